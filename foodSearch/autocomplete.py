@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+"""
+This module suggests products names while the user types a query,
+from a sorted array of names kept in memory (no database query per keystroke)
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+
+from django.conf import settings
+
+from .catalog import get_catalog_version
+from .models import Product
+
+# most suggestions returned for a prefix
+MAX_SUGGESTIONS = 20
+# suggestions of prefixes up to this length are computed when the list is built
+# (they match too many names to be sorted for each request)
+SHORT_PREFIX_LENGTH = 2
+
+# sorted formatted names and ends of names, (nutrition grade, name) of each key,
+# short prefix -> MAX_SUGGESTIONS best names, prefix -> suggestions of frequent prefixes
+Names = namedtuple('Names', ('keys', 'entries', 'short_prefixes', 'cache'))
+
+
+class Autocomplete:
+    """
+    This class keeps formatted names of products (and each end of name
+    starting with a word) in a sorted list, so that names starting with
+    a prefix are found with a binary search
+    """
+
+    def __init__(self, cache_size=1000):
+        # replaced at once by build(), so that suggest() never mixes two lists
+        self.names = Names([], [], {}, {})
+        self.catalog_version = None
+        self.last_check = 0
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+
+    def build(self):
+        """
+        This method loads products names in a new sorted list, then swaps it in
+        """
+        rows = []
+        for formatted_name, name, grade in Product.objects.values_list(
+                'formatted_name', 'name', 'nutrition_grade_fr'):
+            words = formatted_name.split()
+            for i in range(len(words)):
+                rows.append((' '.join(words[i:]), grade or 'z', name))
+        rows.sort()
+        keys = [row[0] for row in rows]
+        entries = [(row[1], row[2]) for row in rows]
+        short_prefixes = {}
+        for length in range(1, SHORT_PREFIX_LENGTH + 1):
+            start = 0
+            while start < len(keys):
+                prefix = keys[start][:length]
+                if len(prefix) < length:
+                    start += 1
+                    continue
+                end = bisect_left(keys, prefix + '\uffff', start)
+                short_prefixes[prefix] = self.best_names(entries, start, end, MAX_SUGGESTIONS)
+                start = end
+        self.names = Names(keys, entries, short_prefixes, {})
+
+    @staticmethod
+    def best_names(entries, start, end, number):
+        """
+        This method returns the number first names of entries from start to end,
+        best nutrition grades first
+        """
+        names = []
+        for _, name in sorted(entries[start:end]):
+            if name not in names:
+                names.append(name)
+                if len(names) == number:
+                    break
+        return names
+
+    def refresh_if_needed(self):
+        """
+        This method rebuilds the list when the catalog version changed,
+        at most once per AUTOCOMPLETE_REFRESH_INTERVAL seconds
+        """
+        interval = getattr(settings, 'AUTOCOMPLETE_REFRESH_INTERVAL', 60)
+        with self.lock:
+            if time.time() - self.last_check >= interval:
+                version = get_catalog_version()
+                if version != self.catalog_version:
+                    self.build()
+                    self.catalog_version = version
+                self.last_check = time.time()
+
+    def suggest(self, prefix, number=10):
+        """
+        This method returns names of products starting with the prefix
+        (or with a word starting with the prefix),
+        best nutrition grades first
+        """
+        prefix = ' '.join(prefix.split())
+        if not prefix or number < 1:
+            return []
+        names = self.names
+        if len(prefix) <= SHORT_PREFIX_LENGTH and number <= MAX_SUGGESTIONS:
+            return names.short_prefixes.get(prefix, [])[0:number]
+        key = (prefix, number)
+        if key in names.cache:
+            return names.cache[key]
+        start = bisect_left(names.keys, prefix)
+        end = bisect_left(names.keys, prefix + '\uffff', start)
+        suggestions = self.best_names(names.entries, start, end, number)
+        if len(names.cache) >= self.cache_size:
+            names.cache.clear()
+        names.cache[key] = suggestions
+        return suggestions
+
+
+_AUTOCOMPLETE = Autocomplete()
+
+
+def get_autocomplete():
+    """
+    This function returns the autocomplete list of the worker, refreshed if needed
+    """
+    _AUTOCOMPLETE.refresh_if_needed()
+    return _AUTOCOMPLETE
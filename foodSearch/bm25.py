@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""
+This module ranks products of the search index with Okapi BM25:
+rare words of a query weigh more than words found in many products
+"""
+
+import numpy as np
+
+
+class BM25Matrix:
+    """
+    This class stores the words x products matrix of the search index
+    in compressed sparse rows arrays (one row per word, term frequencies as values)
+    so that all products matching a query are scored with numpy array operations
+    It is built from a copy of the index products (product id -> words),
+    so that the index can change meanwhile
+    """
+
+    def __init__(self, products, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.product_ids = np.array(sorted(products), dtype=np.int64)
+        positions = {product_id: i for i, product_id in enumerate(self.product_ids.tolist())}
+        self.rows = {} # word -> row
+
+        word_rows, columns, frequencies = [], [], []
+        lengths = np.zeros(len(self.product_ids), dtype=np.float64)
+        for product_id, words in products.items():
+            column = positions[product_id]
+            lengths[column] = len(words)
+            counts = {}
+            for word in words:
+                counts[word] = counts.get(word, 0) + 1
+            for word, frequency in counts.items():
+                word_rows.append(self.rows.setdefault(word, len(self.rows)))
+                columns.append(column)
+                frequencies.append(frequency)
+
+        word_rows = np.array(word_rows, dtype=np.int64)
+        order = np.argsort(word_rows, kind='stable')
+        self.columns = np.array(columns, dtype=np.int64)[order]
+        self.frequencies = np.array(frequencies, dtype=np.float64)[order]
+        self.indptr = np.zeros(len(self.rows) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(word_rows, minlength=len(self.rows)), out=self.indptr[1:])
+
+        nb_products = len(self.product_ids)
+        document_frequencies = np.diff(self.indptr).astype(np.float64)
+        self.idf = np.log(1 + (nb_products - document_frequencies + 0.5)
+                          / (document_frequencies + 0.5))
+        average_length = lengths.mean() if nb_products else 1.0
+        # length normalization of each product, computed once
+        self.norms = k1 * (1 - b + b * lengths / average_length)
+
+    def scores(self, rows):
+        """
+        This method returns positions and BM25 scores of products
+        having at least one word of the given rows
+        """
+        if not rows:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+        slices = [np.arange(self.indptr[row], self.indptr[row + 1]) for row in rows]
+        entries = np.concatenate(slices)
+        idf = np.repeat(self.idf[rows], [len(entries_slice) for entries_slice in slices])
+        columns = self.columns[entries]
+        frequencies = self.frequencies[entries]
+        weights = idf * frequencies * (self.k1 + 1) / (frequencies + self.norms[columns])
+        positions, inverse = np.unique(columns, return_inverse=True)
+        return positions, np.bincount(inverse, weights=weights)
+
+    def ranked_ids(self, index, words, number):
+        """
+        This method returns ids of the best products for the query words
+        (each word counts with all the words of the vocabulary containing it,
+        words added to the index after the matrix was built are ignored)
+        """
+        rows = []
+        for word in words:
+            rows.extend(self.rows[token] for token in index.matching_words(word)
+                        if token in self.rows)
+        positions, scores = self.scores(rows)
+        ids = self.product_ids[positions]
+        # best scores first, then smallest ids
+        order = np.lexsort((ids, -scores))[0:number]
+        return ids[order].tolist()
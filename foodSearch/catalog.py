@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+"""
+This module manages the version of the products catalog,
+increased by fill_db each time products are loaded in database.
+Caches use it to drop results computed with an older catalog
+"""
+
+import time
+
+from django.core.cache import caches
+
+CATALOG_VERSION_KEY = 'catalog_version'
+
+
+def get_catalog_cache():
+    """
+    This function returns the cache shared by all workers and commands
+    """
+    return caches['shared']
+
+
+def get_catalog_version():
+    """
+    This function returns the current version of the catalog
+    """
+    cache = get_catalog_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # start from the current time, so that versions used before
+        # the shared cache was cleared are never used again
+        cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000000), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """
+    This function increases the version of the catalog
+    """
+    cache = get_catalog_cache()
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # no version yet
+        return get_catalog_version()
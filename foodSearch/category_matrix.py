@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+"""
+This module keeps the products x categories relation in memory
+so that substitutes of a product are found with numpy array operations,
+without querying products of its categories
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from django.conf import settings
+
+from .catalog import get_catalog_version
+from .models import Product, ProductCategory
+
+# ids of products, product id -> position in arrays, nutrition grades,
+# compressed sparse rows of category ids of each product,
+# category id -> positions of its products
+Arrays = namedtuple('Arrays', ('product_ids', 'positions', 'grades', 'indptr',
+                               'categories', 'members'))
+
+
+class CategoryMatrix:
+    """
+    This class stores categories of each product in compressed sparse rows arrays
+    (ordered by position in the product's hierarchy), products of each
+    category in id arrays and nutrition grades in an array parallel to products
+    """
+
+    def __init__(self):
+        # replaced at once by build(), so that readers never mix two versions
+        self.arrays = Arrays(np.array([], dtype=np.int64), {}, np.array([], dtype='<U1'),
+                             np.zeros(1, dtype=np.int64), np.array([], dtype=np.int64), {})
+        self.catalog_version = None
+        self.last_check = 0
+        self.lock = threading.Lock()
+
+    def build(self):
+        """
+        This method loads products and the foodSearch_category_products table
+        in new arrays, then swaps them in
+        """
+        products = list(Product.objects.order_by('id').values_list('id', 'nutrition_grade_fr'))
+        product_ids = np.array([row[0] for row in products], dtype=np.int64)
+        positions = {product_id: i for i, (product_id, _) in enumerate(products)}
+        grades = np.array([row[1] for row in products], dtype='<U1')
+
+        links = ProductCategory.objects.order_by('position', 'id').values_list(
+            'product_id', 'category_id')
+        rows, categories = [], []
+        for product_id, category_id in links.iterator():
+            if product_id not in positions:
+                continue # product created while loading
+            rows.append(positions[product_id])
+            categories.append(category_id)
+        rows = np.array(rows, dtype=np.int64)
+        categories = np.array(categories, dtype=np.int64)
+
+        # stable sort keeps categories of a product ordered by position
+        order = np.argsort(rows, kind='stable')
+        product_categories = categories[order]
+        indptr = np.zeros(len(products) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(products)), out=indptr[1:])
+
+        members = {}
+        if len(categories):
+            order = np.argsort(categories, kind='stable')
+            sorted_categories = categories[order]
+            starts = np.flatnonzero(np.r_[True, sorted_categories[1:] != sorted_categories[:-1]])
+            for category_id, category_positions in zip(sorted_categories[starts].tolist(),
+                                              np.split(rows[order], starts[1:])):
+                members[category_id] = category_positions
+        self.arrays = Arrays(product_ids, positions, grades, indptr, product_categories, members)
+
+    def refresh_if_needed(self):
+        """
+        This method rebuilds the matrix when the catalog version changed,
+        at most once per SUBSTITUTE_MATRIX_REFRESH_INTERVAL seconds
+        """
+        interval = getattr(settings, 'SUBSTITUTE_MATRIX_REFRESH_INTERVAL', 60)
+        with self.lock:
+            if time.time() - self.last_check >= interval:
+                version = get_catalog_version()
+                if version != self.catalog_version:
+                    self.build()
+                    self.catalog_version = version
+                self.last_check = time.time()
+
+    def __contains__(self, product_id):
+        return product_id in self.arrays.positions
+
+    def products_same_categories(self, product):
+        """
+        This method returns substitutes of the product with the number
+        of categories in common, like SubstitutesRanking.products_same_categories
+        (None if the product was not loaded in the matrix)
+        """
+        arrays = self.arrays
+        position = arrays.positions.get(product.id)
+        if position is None:
+            return None
+        found_categories = arrays.categories[arrays.indptr[position]:arrays.indptr[position + 1]]
+        if not len(found_categories):
+            return []
+        # products of the 3 most specific categories of the product (last 3)
+        positions = np.unique(np.concatenate([arrays.members[category_id]
+                                              for category_id in found_categories[-3:].tolist()]))
+        grades = arrays.grades[positions]
+        if product.nutrition_grade_fr == 'a':
+            positions = positions[grades == 'a']
+        else:
+            positions = positions[grades < product.nutrition_grade_fr]
+
+        # categories in common, read in the categories of the candidates only
+        # (not in the products of the product's categories, large for generic ones)
+        starts = arrays.indptr[positions]
+        lengths = arrays.indptr[positions + 1] - starts
+        rows = np.repeat(np.arange(len(positions)), lengths)
+        entries = starts[rows] + np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths,
+                                                                   lengths)
+        common = np.isin(arrays.categories[entries], found_categories)
+        occurences = np.bincount(rows, weights=common, minlength=len(positions)).astype(np.int64)
+        return [{'id':product_id, 'nb':nb}
+                for product_id, nb in zip(arrays.product_ids[positions].tolist(),
+                                          occurences.tolist())]
+
+
+_CATEGORY_MATRIX = CategoryMatrix()
+
+
+def get_category_matrix():
+    """
+    This function returns the category matrix of the worker, rebuilt if needed
+    """
+    _CATEGORY_MATRIX.refresh_if_needed()
+    return _CATEGORY_MATRIX
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+"""
+This module writes pages of products with PostgreSQL only: products and their
+categories of a batch of pages are streamed in unlogged staging tables with COPY,
+then merged in the products, categories and links tables with a few set-based queries
+"""
+
+import io
+import os
+
+from django.db import connection as default_connection
+
+from .models import Category, Product, ProductCategory
+
+# columns of the staging table of products, in the products table too
+TEXT_FIELDS = ('reference', 'name', 'formatted_name', 'brands', 'formatted_brands',
+               'url', 'image_url', 'image_small_url', 'nutrition_grade_fr', 'content_hash')
+# missing nutrients keep their previous value when a product is updated
+FLOAT_FIELDS = ('saturated_fat_100g', 'carbohydrates_100g', 'energy_100g',
+                'sugars_100g', 'sodium_100g', 'salt_100g')
+
+
+def copy_value(value):
+    """
+    This function returns a value in the text format of COPY
+    """
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class CopyLoader:
+    """
+    This class loads pages of products parsed by fill_db (InitDB.parse_page())
+    with COPY and INSERT ... ON CONFLICT queries, with the same rules as the ORM:
+    unchanged products (same content hash) are not written, a product keeping
+    the reference of another one is skipped, categories of an existing product
+    are replaced when there are more of them
+    """
+
+    def __init__(self, connection=None):
+        self.connection = connection or default_connection
+        # a table for each process, so that processes don't lock each other
+        self.products_table = 'foodsearch_staging_product_{}'.format(os.getpid())
+        self.categories_table = 'foodsearch_staging_category_{}'.format(os.getpid())
+        self.created = False # staging tables created
+
+    @staticmethod
+    def available(connection=None):
+        """
+        This method returns True if the database supports this loader
+        """
+        return (connection or default_connection).vendor == 'postgresql'
+
+    def names(self):
+        """
+        This method returns quoted names of tables used in queries
+        """
+        quote = self.connection.ops.quote_name
+        return {
+            'product': quote(Product._meta.db_table),
+            'category': quote(Category._meta.db_table),
+            'link': quote(ProductCategory._meta.db_table),
+            'staging_product': quote(self.products_table),
+            'staging_category': quote(self.categories_table),
+        }
+
+    def create_staging_tables(self, cursor):
+        """
+        This method creates the staging tables, not written in the WAL
+        """
+        columns = (['"{}" text'.format(field) for field in TEXT_FIELDS]
+                   + ['"{}" double precision'.format(field) for field in FLOAT_FIELDS])
+        cursor.execute('CREATE UNLOGGED TABLE IF NOT EXISTS {staging_product} ({columns})'
+                       .format(columns=', '.join(columns), **self.names()))
+        cursor.execute('CREATE UNLOGGED TABLE IF NOT EXISTS {staging_category} '
+                       '("name" text, "category" text, "position" integer)'
+                       .format(**self.names()))
+        self.created = True
+
+    def drop_staging_tables(self):
+        """
+        This method drops the staging tables at the end of a run
+        """
+        if not self.created:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS {staging_product}, {staging_category}'
+                           .format(**self.names()))
+        self.created = False
+
+    @staticmethod
+    def copy_rows(cursor, table, columns, rows):
+        """
+        This method streams rows in a table with COPY FROM STDIN
+        """
+        data = io.StringIO()
+        for row in rows:
+            data.write('\t'.join(copy_value(value) for value in row))
+            data.write('\n')
+        data.seek(0)
+        cursor.copy_expert('COPY {} ({}) FROM STDIN'
+                           .format(table, ', '.join('"{}"'.format(column) for column in columns)),
+                           data)
+
+    def load_page(self, parsed):
+        """
+        This method writes products of a page or a batch of pages
+        (to be called in a transaction)
+        and returns ids of created products, ids of updated products,
+        the number of unchanged products and ids of categories of the written
+        products (before and after they were written)
+        """
+        names = self.names()
+        fields = TEXT_FIELDS + FLOAT_FIELDS
+        with self.connection.cursor() as cursor:
+            # again after a rolled back page
+            self.create_staging_tables(cursor)
+            cursor.execute('TRUNCATE {staging_product}, {staging_category}'.format(**names))
+            self.copy_rows(cursor, names['staging_product'], fields,
+                           [[product_fields.get(field) for field in fields]
+                            for product_fields, _ in parsed.values()])
+            self.copy_rows(cursor, names['staging_category'], ('name', 'category', 'position'),
+                           [(name, category, position)
+                            for name, (_, categories) in parsed.items()
+                            for position, category in enumerate(categories)])
+
+            cursor.execute('SELECT count(*) FROM {staging_product} new '
+                           'JOIN {product} product ON product."name" = new."name" '
+                           'AND product."content_hash" = new."content_hash"'.format(**names))
+            unchanged = cursor.fetchone()[0]
+
+            updates = ['"{0}" = EXCLUDED."{0}"'.format(field) for field in TEXT_FIELDS]
+            updates += ['"{0}" = COALESCE(EXCLUDED."{0}", product."{0}")'.format(field)
+                        for field in FLOAT_FIELDS]
+            cursor.execute(
+                'INSERT INTO {product} AS product ({columns}, "updated_at") '
+                'SELECT {new_columns}, now() FROM {staging_product} new '
+                'LEFT JOIN {product} old ON old."name" = new."name" '
+                'WHERE (old."id" IS NULL OR old."content_hash" <> new."content_hash") '
+                # reference of another product
+                'AND NOT EXISTS (SELECT 1 FROM {product} other '
+                'WHERE other."reference" = new."reference" AND other."name" <> new."name") '
+                # sorted, so that processes writing the same products lock them in the same order
+                'ORDER BY new."name" '
+                'ON CONFLICT ("name") DO UPDATE SET {updates}, "updated_at" = EXCLUDED."updated_at" '
+                'RETURNING product."id", (product."xmax" = 0)'
+                .format(columns=', '.join('"{}"'.format(field) for field in fields),
+                        new_columns=', '.join('new."{}"'.format(field) for field in fields),
+                        updates=', '.join(updates), **names))
+            written = cursor.fetchall()
+            created_ids = [product_id for product_id, created in written if created]
+            updated_ids = [product_id for product_id, created in written if not created]
+            if not written:
+                return created_ids, updated_ids, unchanged, set()
+
+            # sorted, so that processes loading the same categories lock them in the same order
+            cursor.execute('INSERT INTO {category} ("reference") '
+                           'SELECT DISTINCT new."category" FROM {staging_category} new '
+                           'JOIN {product} product ON product."name" = new."name" '
+                           'WHERE product."id" = ANY(%s) ORDER BY new."category" '
+                           'ON CONFLICT ("reference") DO NOTHING'.format(**names),
+                           [created_ids + updated_ids])
+            category_ids = set()
+            if updated_ids:
+                cursor.execute('SELECT DISTINCT "category_id" FROM {link} '
+                               'WHERE "product_id" = ANY(%s)'.format(**names), [updated_ids])
+                category_ids.update(row[0] for row in cursor.fetchall())
+                cursor.execute('DELETE FROM {link} link USING ('
+                               'SELECT product."id" FROM {product} product '
+                               'JOIN (SELECT "name", count(*) AS total FROM {staging_category} '
+                               'GROUP BY "name") new ON new."name" = product."name" '
+                               'WHERE product."id" = ANY(%s) AND new.total > '
+                               '(SELECT count(*) FROM {link} old WHERE old."product_id" = product."id")'
+                               ') replaced WHERE link."product_id" = replaced."id"'.format(**names),
+                               [updated_ids])
+            # products without categories: created products and replaced categories
+            cursor.execute('INSERT INTO {link} ("category_id", "product_id", "position") '
+                           'SELECT category."id", product."id", new."position" '
+                           'FROM {staging_category} new '
+                           'JOIN {product} product ON product."name" = new."name" '
+                           'JOIN {category} category ON category."reference" = new."category" '
+                           'WHERE product."id" = ANY(%s) AND NOT EXISTS '
+                           '(SELECT 1 FROM {link} old WHERE old."product_id" = product."id") '
+                           'ON CONFLICT DO NOTHING RETURNING "category_id"'.format(**names),
+                           [created_ids + updated_ids])
+            category_ids.update(row[0] for row in cursor.fetchall())
+        return created_ids, updated_ids, unchanged, category_ids
@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+
+"""
+This module finds which products are saved as favorite by a user,
+so that results pages know which substitutes are saved without a query per substitute
+"""
+
+from .models import Favorite
+
+
+def get_favorite_ids(user, product_ids=None):
+    """
+    This function returns the set of substitutes ids saved as favorite by the user,
+    among product_ids (the products of a results page) if given,
+    in a single query on the (user, substitute) unique index
+    """
+    if not user.is_authenticated:
+        return set()
+    favorites = Favorite.objects.filter(user=user)
+    if product_ids is not None:
+        if not product_ids:
+            return set()
+        favorites = favorites.filter(substitute_id__in=list(product_ids))
+    return set(favorites.values_list('substitute_id', flat=True))
@@ -0,0 +1,37 @@
+#! /usr/bin/env python3
+# coding: utf-8
+
+"""
+This module create a command precomputing substitutes of products
+in order to display results pages without ranking them again
+"""
+
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from foodSearch.catalog import bump_catalog_version
+from foodSearch.substitutes import SubstitutesBuilder
+
+
+class Command(BaseCommand):
+    """Compute substitutes of all products or of some products - option: products"""
+
+    def add_arguments(self, parser):
+        """Class arguments : products"""
+        parser.add_argument("-p",
+                            "--products",
+                            nargs="+",
+                            type=int,
+                            dest="products",
+                            help="Compute only these products and products sharing a category with them")
+
+    def handle(self, **options):
+        """Class handler, compute substitutes"""
+        builder = SubstitutesBuilder()
+        computed = builder.compute(options["products"])
+        # drop substitutes cached with the previous ones
+        bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS("{} : Substituts calculés pour {} produits"
+                                             .format(datetime.datetime.now(), computed)))
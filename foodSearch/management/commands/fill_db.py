@@ -6,30 +6,67 @@ This module create a command allowing user to reset or fill database
 with datas from openfactfood api in order to use them in the appliaction foodSearch
 """
 
+import hashlib
+import json
+import multiprocessing
+import os
 import time
 import datetime
+from concurrent.futures import ProcessPoolExecutor
 from statistics import mean
-import unicodedata
 
 from django.core.management.base import BaseCommand
-from django.db import transaction
-
-import openfoodfacts
-
-from foodSearch.models import Category, Product, Favorite
+from django.db import IntegrityError, OperationalError, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from foodSearch.catalog import bump_catalog_version
+from foodSearch.copy_loader import CopyLoader
+from foodSearch.models import Category, Product, ProductCategory, Favorite, FillCheckpoint
+from foodSearch.normalize import upper_unaccent
+from foodSearch.off_dump import dump_products, pages
+from foodSearch.off_pipeline import PagePipeline, RecordedPages
+from foodSearch.substitutes import SubstitutesBuilder
 from .settings import FIRST_PAGE, LAST_PAGE, DB_REPORTS_FILE
 
+# attempts of a page after a conflict with another process
+PAGE_RETRIES = 2
+# with the COPY loader, pages are written together once this many products are pending
+COPY_BATCH_SIZE = 5000
+# PostgreSQL error codes of transactions to try again
+DEADLOCK_DETECTED = "40P01"
+SERIALIZATION_FAILURE = "40001"
+# options of the command used to load products, given to worker processes
+LOAD_OPTIONS = ("dump", "first_page", "last_page", "fetch_workers", "resume",
+                "fast_load", "recorded_pages")
+
 
 class InitDB:
     """
     This class defines code relative to reset or fill database
     """
 
-    def __init__(self):
+    def __init__(self, fetch_page=None, fast_load=False):
+        # function returning products of a page (openfoodfacts api by default)
+        self.fetch_page = fetch_page or self.fetch_off_page
+        # pages written with COPY, with PostgreSQL only
+        self.copy_loader = CopyLoader() if fast_load and CopyLoader.available() else None
+        self.pending = {} # products of pages not written yet by the COPY loader, by name
+        self.pending_references = {} # name of each pending product, by reference
+        self.pending_pages = []
+        self.failed_pages = []
         self.tps = []
         self.initial_page = 0
         self.page = 0 # page counter
         self.last_page = 0 # number of page wanted from the api
+        self.touched_ids = set() # products added or updated, to compute their substitutes
+        # categories of these products before and after they were written
+        self.touched_categories = set()
+        self.created_count = 0
+        self.updated_count = 0
+        self.unchanged_count = 0
+        self.checkpoint = None # progress saved with each page
+        self.elapsed = 0 # seconds spent by the previous runs resumed
 
     @staticmethod
     def reset_db():
@@ -37,26 +74,30 @@ class InitDB:
         Category.objects.all().delete()
         Favorite.objects.all().delete()
         Product.objects.all().delete()
+        FillCheckpoint.objects.all().delete()
 
     @staticmethod
     def upper_unaccent(sentence):
         """"return a string in upper case and without any accent"""
         try:
-            sentence_unaccent = "".join(
-                (c for c in unicodedata.normalize("NFD", sentence)
-                 if unicodedata.category(c) != "Mn"))
-            return sentence_unaccent.upper()
+            return upper_unaccent(sentence)
         except:
             return sentence
 
-    def load_off_page(self):
+    @staticmethod
+    def fetch_off_page(page):
         """load page of products from openfactfood"""
         # use openfactfood api to load pages
+        import openfoodfacts # not in requirements.txt, see README
         page_prods = openfoodfacts.products.get_by_facets(
-            {"country": "france"}, page=self.page, locale="fr"
+            {"country": "france"}, page=page, locale="fr"
         )
         return page_prods
 
+    def load_off_page(self):
+        """load current page of products"""
+        return self.fetch_page(self.page)
+
     def load_product(self, off_product):
         """
         load product's infos from openfactfood page of products into a dictionnary
@@ -112,30 +153,198 @@ class InitDB:
 
         return product_infos
 
-    def load_datas(self, page, last_page):
-        """method loading datas from api in the database"""
+    def start_checkpoint(self, source, first_page, last_page, resume=False):
+        """
+        start the checkpoint of a run, or continue the checkpoint of the previous run
+        of the same pages with resume, and return the first page to load
+        """
+        checkpoint = FillCheckpoint.objects.filter(source=source).first()
+        if (resume and checkpoint
+                and (checkpoint.first_page, checkpoint.last_page) == (first_page, last_page)):
+            self.checkpoint = checkpoint
+            self.created_count = checkpoint.created
+            self.updated_count = checkpoint.updated
+            self.unchanged_count = checkpoint.unchanged
+            self.failed_pages.extend(int(page) for page in checkpoint.failed_pages.split(",") if page)
+            # substitutes of products loaded before the interruption are not computed yet
+            self.touched_ids.update(Product.objects.filter(updated_at__gte=checkpoint.started_at)
+                                    .values_list("id", flat=True))
+            # (their previous categories are lost)
+            self.touched_categories.update(
+                ProductCategory.objects.filter(product__updated_at__gte=checkpoint.started_at)
+                .values_list("category_id", flat=True))
+            return checkpoint.page + 1
+        if checkpoint:
+            checkpoint.delete()
+        self.checkpoint = FillCheckpoint.objects.create(source=source,
+                                                        first_page=first_page,
+                                                        last_page=last_page,
+                                                        page=first_page - 1,
+                                                        started_at=timezone.now())
+        return first_page
+
+    def save_checkpoint(self, page, elapsed):
+        """save progress of the run, page being the last loaded page"""
+        checkpoint = self.checkpoint
+        checkpoint.page = page
+        checkpoint.failed_pages = ",".join(str(failed) for failed in sorted(set(self.failed_pages)))
+        checkpoint.created = self.created_count
+        checkpoint.updated = self.updated_count
+        checkpoint.unchanged = self.unchanged_count
+        checkpoint.elapsed = self.elapsed + elapsed
+        checkpoint.save()
+
+    def write_page(self, page, page_prods, start_time):
+        """
+        write a page of products and the checkpoint of the run in one transaction,
+        so that a resumed run starts right after the last written page
+        With the COPY loader, pages are kept until COPY_BATCH_SIZE products are pending,
+        then written together (staging tables are loaded and merged once per batch)
+        """
+        if self.copy_loader:
+            self.add_pending(self.parse_page(page_prods))
+            self.pending_pages.append(page)
+            if len(self.pending) >= COPY_BATCH_SIZE:
+                self.flush_pages(start_time)
+            return
+        self.write_pages([page], lambda: self.load_page(page_prods), start_time)
+
+    def add_pending(self, parsed):
+        """
+        add parsed products of a page to the pending products of the COPY loader,
+        a product of a later page replaces the pending one of the same name
+        """
+        for name, (fields, categories) in parsed.items():
+            reference = fields["reference"]
+            if self.pending_references.get(reference, name) != name:
+                continue # reference of another product of the batch
+            if name in self.pending:
+                del self.pending_references[self.pending[name][0]["reference"]]
+            self.pending[name] = (fields, categories)
+            self.pending_references[reference] = name
+
+    def flush_pages(self, start_time):
+        """write the pending pages of the COPY loader in one batch"""
+        if not self.pending_pages:
+            return
+        pending = self.pending
+        self.write_pages(self.pending_pages, lambda: self.load_parsed(pending), start_time)
+        self.pending, self.pending_references, self.pending_pages = {}, {}, []
+
+    def write_pages(self, written_pages, write, start_time):
+        """
+        call write() and save the checkpoint of the run in one transaction,
+        written_pages being the pages of the written products
+        A page failed by a previous run is written again before the next pages:
+        it is removed from the failed pages, the last written page is kept
+        """
+        for attempt in range(PAGE_RETRIES + 1):
+            counts = (self.created_count, self.updated_count, self.unchanged_count)
+            failed_pages = list(self.failed_pages)
+            try:
+                with transaction.atomic():
+                    write()
+                    # the list is shared with the pipeline, changed in place
+                    self.failed_pages[:] = [failed for failed in self.failed_pages
+                                            if failed not in written_pages]
+                    self.save_checkpoint(max(max(written_pages), self.checkpoint.page),
+                                         time.time() - start_time)
+                break
+            except (IntegrityError, OperationalError) as error:
+                # products of the page are counted again by the next attempt
+                self.created_count, self.updated_count, self.unchanged_count = counts
+                self.failed_pages[:] = failed_pages
+                if attempt == PAGE_RETRIES or not self.is_conflict(error):
+                    raise
+        self.tps.extend([round((time.time() - start_time), 1)] * len(written_pages))
+
+    @staticmethod
+    def is_conflict(error):
+        """
+        return True if a page failed because of another process writing the same rows:
+        a product created meanwhile (updated by the next attempt) or a deadlock
+        """
+        if isinstance(error, IntegrityError):
+            return True
+        return getattr(error.__cause__, "pgcode", None) in (DEADLOCK_DETECTED,
+                                                             SERIALIZATION_FAILURE)
+
+    def report(self):
+        """
+        return counts of the run, to be aggregated with runs of other processes
+        """
+        return {
+            "first_page": self.initial_page,
+            "last_page": self.last_page,
+            "pages": len(self.tps),
+            "seconds": self.tps[-1] if self.tps else 0, # of this run only
+            "elapsed": self.checkpoint.elapsed if self.checkpoint else 0,
+            "created": self.created_count,
+            "updated": self.updated_count,
+            "unchanged": self.unchanged_count,
+            "failed_pages": list(self.failed_pages),
+            "touched_ids": self.touched_ids,
+            "touched_categories": self.touched_categories,
+        }
+
+    def load_dump(self, path, page_size=500, resume=False):
+        """
+        method loading french products of an openfoodfacts dump file in the database,
+        by pages of page_size products (the file is read product by product)
+        with resume, pages loaded by the previous run of this file are skipped
+        """
+        self.initial_page = 1
+        self.page = 0
+        first_page = self.start_checkpoint("dump:" + os.path.abspath(path), 1, None, resume)
+        self.elapsed = self.checkpoint.elapsed
+        start_time = time.time()
+
+        for page_prods in pages(dump_products(path), page_size):
+            self.page += 1
+            if self.page >= first_page:
+                self.write_page(self.page, page_prods, start_time)
+        self.flush_pages(start_time)
+        self.last_page = self.page
+
+    def load_datas(self, page, last_page, fetch_workers=0, resume=False, source="api"):
+        """
+        method loading datas from api in the database
+        with fetch_workers, pages are fetched by a pool of threads
+        while previous pages are written
+        with resume, the run continues after the last page loaded by the previous run
+        (of the same source: each shard of pages has its own checkpoint),
+        pages failed by the previous run are fetched again first
+        """
 
         self.initial_page = page
-        self.page = page # page counter
         self.last_page = last_page # number of page wanted from the api
+        self.page = self.start_checkpoint(source, page, last_page, resume) # page counter
+        self.elapsed = self.checkpoint.elapsed
         start_time = time.time()
-
+        retried_pages = sorted(set(self.failed_pages))
+
+        if fetch_workers:
+            pipeline = PagePipeline(self.fetch_page,
+                                    lambda page, page_prods: self.write_page(page, page_prods,
+                                                                             start_time),
+                                    workers=fetch_workers)
+            # pages failed before the last written page are saved in the checkpoint
+            pipeline.failed_pages = self.failed_pages
+            pipeline.run_pages(retried_pages + list(range(self.page, self.last_page + 1)))
+            self.flush_pages(start_time)
+            self.failed_pages[:] = sorted(set(self.failed_pages))
+            self.page = self.last_page + 1
+            if self.failed_pages:
+                self.save_checkpoint(self.last_page, time.time() - start_time)
+            return
+
+        for retried_page in retried_pages:
+            self.write_page(retried_page, self.fetch_page(retried_page), start_time)
         while self.page <= self.last_page:
             page_prods = self.load_off_page()
-
-            for off_product in page_prods:
-                product_infos = self.load_product(off_product)
-
-                if not product_infos["required"]["error"]:
-
-                    if Product.objects.filter(name=product_infos["required"]["name"]).exists():
-                        self.update_product(off_product, product_infos)
-                    else:
-                        self.add_product(off_product, product_infos)
-
-            tps_page = round((time.time() - start_time), 1)
-            self.tps.append(tps_page)
+            self.write_page(self.page, page_prods, start_time)
             self.page += 1
+        self.flush_pages(start_time)
 
     @staticmethod
     def keep_eng_categories(off_product):
@@ -150,79 +359,268 @@ class InitDB:
         return parsed_categories
 
     @staticmethod
-    def update_categories(parsed_categories, product):
+    def clean_product_infos(product_infos):
         """
-        Create if needed a new category &
-        Update M2M relation between the produt and categories
+        return product's fields ready to be saved,
+        or None if a required field doesn't fit in its column
         """
-        # insert each category in database only if products
-        # has categories infos(no keyerror in product["categories_hierarchy"])
-
-        with transaction.atomic():
+        fields = {}
+        for name, value in product_infos["required"].items():
+            if name == "error":
+                continue
+            max_length = Product._meta.get_field(name).max_length
+            if not isinstance(value, str) or (max_length and len(value) > max_length):
+                return None
+            fields[name] = value
+        if not fields["name"] or not fields["reference"]:
+            return None
+        for name, value in product_infos["optional"].items():
             try:
-                for category in parsed_categories:
-                    try:
-                        # try to get the category in database
-                        cat = Category.objects.get(reference=category)
-                    except Category.DoesNotExist:
-                        # if category doesn"t exist yet, create one
-                        cat = Category.objects.create(reference=category)
-                        # categ = Category.objects.get(reference=category)
-                    # in any case, add a relation between Category and Product
-                    cat.products.add(product)
-            ###### only keep cleaned datas #######
-            except:
-                pass
+                fields[name] = float(value)
+            except (TypeError, ValueError):
+                pass # only keep cleaned datas
+        return fields
 
-    def add_product(self, off_product, product_infos):
+    @staticmethod
+    def content_hash(fields, categories):
         """
-        create a new product in database
+        return a hash of product's ingested fields and categories,
+        to only write products which changed since they were loaded
         """
-        with transaction.atomic():
-            # insert each product in database
+        content = json.dumps([sorted(fields.items()), categories], ensure_ascii=False)
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
 
+    def parse_page(self, page_prods):
+        """
+        return fields and categories of complete products of a page,
+        in a dictionnary by product name (a name or a reference is only kept once)
+        """
+        parsed = {}
+        references = set()
+        for off_product in page_prods:
+            product_infos = self.load_product(off_product)
+            if product_infos["required"]["error"]:
+                continue
+            fields = self.clean_product_infos(product_infos)
+            if fields is None or fields["name"] in parsed or fields["reference"] in references:
+                continue
             try:
-                new_product = Product.objects.create(
-                    reference=product_infos["required"]["reference"],
-                    name=product_infos["required"]["name"],
-                    formatted_name=product_infos["required"]["formatted_name"],
-                    brands=product_infos["required"]["brands"],
-                    formatted_brands=product_infos["required"]["formatted_brands"],
-                    nutrition_grade_fr=product_infos["required"]["nutrition_grade_fr"],
-                    url=product_infos["required"]["url"],
-                    image_url=product_infos["required"]["image_url"],
-                    image_small_url=product_infos["required"]["image_small_url"],
-                )
-                Product.objects.filter(pk=new_product.id).update(**product_infos["optional"])
-
-                parsed_categories = self.keep_eng_categories(off_product)
-                self.update_categories(parsed_categories,
-                                       new_product)
-
-            ###### only keep cleaned datas #######
-            except:
-                pass
+                categories = [category for category in self.keep_eng_categories(off_product)
+                              if len(category) <= Category._meta.get_field("reference").max_length]
+            except (KeyError, TypeError):
+                categories = []
+            references.add(fields["reference"])
+            fields["content_hash"] = self.content_hash(fields, categories)
+            # a category is only kept once, at its first position
+            parsed[fields["name"]] = (fields, list(dict.fromkeys(categories)))
+        return parsed
+
+    @staticmethod
+    def get_or_create_categories(references):
+        """
+        return ids of categories by reference, creating missing ones in bulk
+        """
+        categories = dict(Category.objects.filter(reference__in=references)
+                          .values_list("reference", "id"))
+        # sorted, so that processes creating the same categories lock them in the same order
+        missing = [Category(reference=reference) for reference in sorted(references)
+                   if reference not in categories]
+        if missing:
+            # another process may have created some of them meanwhile
+            Category.objects.bulk_create(missing, ignore_conflicts=True)
+            categories = dict(Category.objects.filter(reference__in=references)
+                              .values_list("reference", "id"))
+        return categories
+
+    def load_page(self, page_prods):
+        """
+        insert or update products of a page of openfactfood datas with bulk queries,
+        in one transaction
+        """
+        self.load_parsed(self.parse_page(page_prods))
 
-    def update_product(self, off_product, product_infos):
+    def load_parsed(self, parsed):
         """
-        Update product's informations
+        insert or update parsed products (see parse_page()) with bulk queries,
+        in one transaction
         """
+        if not parsed:
+            return
+        if self.copy_loader:
+            with transaction.atomic():
+                created_ids, updated_ids, unchanged, category_ids = \
+                    self.copy_loader.load_page(parsed)
+            self.touched_ids.update(created_ids, updated_ids)
+            self.touched_categories.update(category_ids)
+            self.created_count += len(created_ids)
+            self.updated_count += len(updated_ids)
+            self.unchanged_count += unchanged
+            return
         with transaction.atomic():
-            # insert each product in database
+            existing = {}
+            taken_references = {}
+            for product in Product.objects.filter(Q(name__in=list(parsed))
+                                                  | Q(reference__in=[fields["reference"]
+                                                                     for fields, _ in parsed.values()])):
+                existing[product.name] = product
+                taken_references[product.reference] = product.name
+
+            to_create, to_update = [], []
+            written = {} # products created or changed, by name
+            unchanged = 0
+            now = timezone.now()
+            # sorted, so that processes writing the same products lock them in the same order
+            for name, (fields, product_categories) in sorted(parsed.items()):
+                if taken_references.get(fields["reference"], name) != name:
+                    continue # reference of another product
+                if name in existing:
+                    product = existing[name]
+                    if product.content_hash == fields["content_hash"]:
+                        unchanged += 1
+                        continue
+                    for field, value in fields.items():
+                        setattr(product, field, value)
+                    # bulk_update() doesn't set auto_now fields,
+                    # updated_at is needed to refresh the search index
+                    product.updated_at = now
+                    to_update.append(product)
+                else:
+                    to_create.append(Product(**fields))
+                written[name] = (fields, product_categories)
+            if not written:
+                self.unchanged_count += unchanged
+                return
+            to_update.sort(key=lambda product: product.id)
+            update_fields = sorted({field for fields, _ in written.values() for field in fields}
+                                   | {"updated_at"})
+            if to_update:
+                Product.objects.bulk_update(to_update, update_fields)
+            if to_create:
+                Product.objects.bulk_create(to_create)
+                # ids are not returned by every database
+                for name, product_id in Product.objects.filter(
+                        name__in=[product.name for product in to_create]).values_list("name", "id"):
+                    existing[name] = Product(id=product_id, name=name)
+
+            categories = self.get_or_create_categories(
+                {category for _, product_categories in written.values()
+                 for category in product_categories})
+            category_ids = self.update_categories_links(written, existing,
+                                                        {product.name for product in to_create},
+                                                        categories)
+            self.touched_categories.update(category_ids)
+            self.touched_ids.update(product.id for product in to_update)
+            self.touched_ids.update(existing[product.name].id for product in to_create)
+            self.created_count += len(to_create)
+            self.updated_count += len(to_update)
+            self.unchanged_count += unchanged
 
-            try:
-                product = Product.objects.filter(name=product_infos["required"]["name"])
-                del product_infos["required"]["error"]
-                product.update(**product_infos["required"])
-                product.update(**product_infos["optional"])
-
-                product = Product.objects.get(name=product_infos["required"]["name"])
-                parsed_categories = self.keep_eng_categories(off_product)
-                if len(parsed_categories) > Category.objects.filter(products__id=product.id).count():
-                    product.categories.clear()
-                    self.update_categories(off_product, product)
-            except:
-                pass
+    @staticmethod
+    def update_categories_links(parsed, products, created_names, categories):
+        """
+        link products of a page with their categories in bulk,
+        with the position of each category in the product's hierarchy
+        Categories of an existing product are replaced when there are more of them
+        Return ids of categories of the products, before and after the links are written
+        """
+        counts = {}
+        category_ids = set()
+        for product_id, category_id in ProductCategory.objects.filter(
+                product_id__in=[products[name].id for name in parsed
+                                if name in products and name not in created_names]
+        ).values_list("product_id", "category_id"):
+            counts[product_id] = counts.get(product_id, 0) + 1
+            category_ids.add(category_id)
+        replaced_ids = []
+        links = []
+        for name, (_, product_categories) in parsed.items():
+            if name not in products:
+                continue
+            product_id = products[name].id
+            if name not in created_names:
+                if len(product_categories) <= counts.get(product_id, 0):
+                    continue
+                replaced_ids.append(product_id)
+            for position, category in enumerate(product_categories):
+                links.append(ProductCategory(product_id=product_id,
+                                             category_id=categories[category],
+                                             position=position))
+        if replaced_ids:
+            ProductCategory.objects.filter(product_id__in=replaced_ids).delete()
+        ProductCategory.objects.bulk_create(links, ignore_conflicts=True)
+        category_ids.update(link.category_id for link in links)
+        return category_ids
+
+
+def fill(options, shard=None):
+    """
+    load products with the options of the command and return the report of the run,
+    shard is the (first page, last page) range of a worker process
+    """
+    fetch_page = None
+    if options["recorded_pages"]:
+        fetch_page = RecordedPages(options["recorded_pages"])
+    database = InitDB(fetch_page, options["fast_load"])
+    try:
+        if options["dump"]:
+            database.load_dump(options["dump"], resume=options["resume"])
+        elif shard:
+            database.load_datas(shard[0], shard[1], options["fetch_workers"], options["resume"],
+                                source="api:{}-{}".format(*shard))
+        else:
+            database.load_datas(options["first_page"], options["last_page"],
+                                options["fetch_workers"], options["resume"])
+    finally:
+        if database.copy_loader:
+            database.copy_loader.drop_staging_tables()
+    return database.report()
+
+
+def shard_pages(first_page, last_page, shards):
+    """
+    split pages from first_page to last_page in at most shards ranges of consecutive pages
+    """
+    count = last_page - first_page + 1
+    shards = max(1, min(shards, count))
+    size, extra = divmod(count, shards)
+    ranges = []
+    for shard in range(shards):
+        shard_last = first_page + size + (shard < extra) - 1
+        ranges.append((first_page, shard_last))
+        first_page = shard_last + 1
+    return ranges
+
+
+def fill_shards(options, workers):
+    """
+    load shards of the pages of the command in a pool of worker processes
+    and return their reports
+    """
+    shards = shard_pages(options["first_page"], options["last_page"], workers)
+    # forked workers must open their own connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=len(shards),
+                             mp_context=multiprocessing.get_context("fork")) as pool:
+        futures = [pool.submit(fill, options, shard) for shard in shards]
+        return [future.result() for future in futures]
+
+
+def combine_reports(reports):
+    """
+    return the report of runs of several processes
+    """
+    return {
+        "first_page": min(report["first_page"] for report in reports),
+        "last_page": max(report["last_page"] for report in reports),
+        # processes run at the same time
+        "elapsed": max(report["elapsed"] for report in reports),
+        "created": sum(report["created"] for report in reports),
+        "updated": sum(report["updated"] for report in reports),
+        "unchanged": sum(report["unchanged"] for report in reports),
+        "failed_pages": sorted(page for report in reports for page in report["failed_pages"]),
+        "touched_ids": set().union(*(report["touched_ids"] for report in reports)),
+        "touched_categories": set().union(*(report["touched_categories"] for report in reports)),
+    }
 
 
 class Command(BaseCommand):
@@ -240,6 +638,40 @@ class Command(BaseCommand):
                             action="store_true",
                             dest="fill",
                             help="Fill database")
+        parser.add_argument("--dump",
+                            dest="dump",
+                            help="Load products of an openfoodfacts JSONL or CSV dump file (.gz or not)")
+        parser.add_argument("--first-page",
+                            type=int,
+                            default=FIRST_PAGE,
+                            dest="first_page",
+                            help="First page to load (FIRST_PAGE setting by default)")
+        parser.add_argument("--last-page",
+                            type=int,
+                            default=LAST_PAGE,
+                            dest="last_page",
+                            help="Last page to load (LAST_PAGE setting by default)")
+        parser.add_argument("--fetch-workers",
+                            type=int,
+                            default=0,
+                            dest="fetch_workers",
+                            help="Fetch pages with this number of threads while writing previous pages")
+        parser.add_argument("--workers",
+                            type=int,
+                            default=1,
+                            dest="workers",
+                            help="Split the pages in shards loaded by this number of processes")
+        parser.add_argument("--resume",
+                            action="store_true",
+                            dest="resume",
+                            help="Continue the previous run of the same pages after its last loaded page")
+        parser.add_argument("--fast-load",
+                            action="store_true",
+                            dest="fast_load",
+                            help="Write pages with COPY and set-based queries (PostgreSQL only)")
+        parser.add_argument("--recorded-pages",
+                            dest="recorded_pages",
+                            help="Load pages recorded in json files of this directory instead of the api")
 
     def handle(self, **options):
         """Class handler, launch reset or fill depending on option choice"""
@@ -247,6 +679,7 @@ class Command(BaseCommand):
         if options["reset"]:
             database = InitDB()
             database.reset_db()
+            bump_catalog_version()
 
             self.stdout.write(self.style.SUCCESS("{} : Reset base de données effectué".format(datetime.datetime.now())))
 
@@ -254,17 +687,46 @@ class Command(BaseCommand):
             products = Product.objects.count()
             categories = Category.objects.count()
 
-            database = InitDB()
-            database.load_datas(FIRST_PAGE, LAST_PAGE)
+            if options["fast_load"] and not CopyLoader.available():
+                self.stdout.write("--fast-load needs PostgreSQL, pages are written with the ORM")
+            load_options = {name: options[name] for name in LOAD_OPTIONS}
+            if options["workers"] > 1 and not options["dump"]:
+                reports = fill_shards(load_options, options["workers"])
+            else:
+                reports = [fill(load_options)]
+            report = combine_reports(reports)
+            substitutes = SubstitutesBuilder().compute(report["touched_ids"],
+                                                       report["touched_categories"])
+            # drop results cached with the previous catalog
+            bump_catalog_version()
 
             self.stdout.write(self.style.SUCCESS("""\
             Database updated the {}:
             --- Database UPDATED from page {} to {}
+            --- {} products added, {} products changed, {} products unchanged in {} seconds
             --- {} products in database
-            --- {} categories in database"""
+            --- {} categories in database
+            --- {} products substitutes computed
+            --- pages not loaded: {}"""
                        .format(datetime.datetime.now(),
-                               database.initial_page,
-                               database.last_page,
+                               report["first_page"],
+                               report["last_page"],
+                               report["created"],
+                               report["updated"],
+                               report["unchanged"],
+                               round(report["elapsed"], 1),
                                Product.objects.count(),
                                Category.objects.count(),
+                               substitutes,
+                               report["failed_pages"] or "none",
                                )))
+            if len(reports) > 1:
+                for shard in reports:
+                    self.stdout.write("""\
+            --- pages {} to {}: {} pages, {} products written in {} seconds ({} pages/s)"""
+                                      .format(shard["first_page"],
+                                              shard["last_page"],
+                                              shard["pages"],
+                                              shard["created"] + shard["updated"],
+                                              shard["seconds"],
+                                              round(shard["pages"] / (shard["seconds"] or 1), 2)))
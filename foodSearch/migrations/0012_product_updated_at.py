@@ -0,0 +1,18 @@
+# Generated by Django 3.0.3 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodSearch', '0011_auto_20200328_1850'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Mise à jour'),
+        ),
+    ]
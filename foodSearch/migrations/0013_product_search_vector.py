@@ -0,0 +1,50 @@
+# Generated by Django 3.0.3 on 2026-10-18 11:02
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# search_vector is kept up to date by a trigger and indexed with GIN,
+# only with PostgreSQL (other databases use the in-memory search index)
+POSTGRES_FORWARD_SQL = [
+    """CREATE INDEX "foodSearch_product_search_vector_gin"
+       ON "foodSearch_product" USING GIN ("search_vector")""",
+    """CREATE TRIGGER "foodSearch_product_search_vector_update"
+       BEFORE INSERT OR UPDATE OF "formatted_name", "formatted_brands", "search_vector"
+       ON "foodSearch_product" FOR EACH ROW EXECUTE PROCEDURE
+       tsvector_update_trigger("search_vector", 'pg_catalog.simple',
+                               "formatted_name", "formatted_brands")""",
+    """UPDATE "foodSearch_product" SET "search_vector" =
+       to_tsvector('pg_catalog.simple', "formatted_name" || ' ' || "formatted_brands")""",
+]
+
+POSTGRES_BACKWARD_SQL = [
+    """DROP TRIGGER IF EXISTS "foodSearch_product_search_vector_update" ON "foodSearch_product" """,
+    """DROP INDEX IF EXISTS "foodSearch_product_search_vector_gin" """,
+]
+
+
+def run_postgres_sql(statements):
+    """return a RunPython function executing statements with PostgreSQL only"""
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodSearch', '0012_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(run_postgres_sql(POSTGRES_FORWARD_SQL),
+                             run_postgres_sql(POSTGRES_BACKWARD_SQL)),
+    ]
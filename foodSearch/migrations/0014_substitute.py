@@ -0,0 +1,27 @@
+# Generated by Django 3.0.3 on 2026-10-18 11:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodSearch', '0013_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Substitute',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.IntegerField(verbose_name='Catégories en commun')),
+                ('rank', models.IntegerField(verbose_name='Rang')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='substitutes', to='foodSearch.Product')),
+                ('substitute', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='substitute_for', to='foodSearch.Product')),
+            ],
+            options={
+                'unique_together': {('product', 'rank')},
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.0.3 on 2026-10-18 11:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_positions(apps, schema_editor):
+    """
+    Categories of each product were linked in the order of its hierarchy:
+    positions follow the order of the links
+    """
+    ProductCategory = apps.get_model('foodSearch', 'ProductCategory')
+    links = []
+    product_id, position = None, 0
+    for link in ProductCategory.objects.order_by('product_id', 'id').only('id', 'product_id'):
+        if link.product_id != product_id:
+            product_id, position = link.product_id, 0
+        link.position = position
+        position += 1
+        links.append(link)
+    ProductCategory.objects.bulk_update(links, ['position'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodSearch', '0014_substitute'),
+    ]
+
+    operations = [
+        # the table of the many to many relation already exists,
+        # it becomes the table of the ProductCategory model
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ProductCategory',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='foodSearch.Category')),
+                        ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='foodSearch.Product')),
+                    ],
+                    options={
+                        'db_table': 'foodSearch_category_products',
+                        'unique_together': {('category', 'product')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='category',
+                    name='products',
+                    field=models.ManyToManyField(blank=True, related_name='categories', through='foodSearch.ProductCategory', to='foodSearch.Product'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='productcategory',
+            name='position',
+            field=models.IntegerField(default=0, verbose_name='Position'),
+        ),
+        migrations.AddIndex(
+            model_name='productcategory',
+            index=models.Index(fields=['product', 'position'], name='foodSearch_category_position'),
+        ),
+        migrations.RunPython(set_positions, migrations.RunPython.noop),
+    ]
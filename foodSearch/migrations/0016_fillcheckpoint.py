@@ -0,0 +1,29 @@
+# Generated by Django 3.0.3 on 2026-10-18 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodSearch', '0015_productcategory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FillCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True, verbose_name='Source')),
+                ('first_page', models.IntegerField(verbose_name='Première page')),
+                ('last_page', models.IntegerField(null=True, verbose_name='Dernière page')),
+                ('page', models.IntegerField(verbose_name='Dernière page enregistrée')),
+                ('failed_pages', models.TextField(blank=True, default='', verbose_name='Pages non chargées')),
+                ('created', models.IntegerField(default=0, verbose_name='Produits ajoutés')),
+                ('updated', models.IntegerField(default=0, verbose_name='Produits mis à jour')),
+                ('elapsed', models.FloatField(default=0, verbose_name='Durée')),
+                ('started_at', models.DateTimeField(verbose_name='Début')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Mise à jour')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.0.3 on 2026-10-18 11:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodSearch', '0016_fillcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fillcheckpoint',
+            name='unchanged',
+            field=models.IntegerField(default=0, verbose_name='Produits inchangés'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=40, verbose_name='Empreinte'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.0.3 on 2026-10-18 15:20
+
+from django.db import migrations
+
+
+# words of names and brands are indexed by trigrams to correct misspelled
+# words with the PostgreSQL search backend, only if pg_trgm can be installed
+TRIGRAM_FORWARD_SQL = [
+    """CREATE EXTENSION IF NOT EXISTS pg_trgm""",
+    """CREATE INDEX IF NOT EXISTS "foodSearch_product_words_trgm"
+       ON "foodSearch_product" USING GIN (("formatted_name" || ' ' || "formatted_brands")
+       gin_trgm_ops)""",
+]
+
+TRIGRAM_BACKWARD_SQL = [
+    """DROP INDEX IF EXISTS "foodSearch_product_words_trgm" """,
+]
+
+
+def run_trigram_sql(statements):
+    """return a RunPython function executing statements if pg_trgm is available"""
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodSearch', '0017_product_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_trigram_sql(TRIGRAM_FORWARD_SQL),
+                             run_trigram_sql(TRIGRAM_BACKWARD_SQL)),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.0.3 on 2026-10-18 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodSearch', '0018_product_trigram_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Nom')),
+                ('count', models.BigIntegerField(default=0, verbose_name='Nombre')),
+            ],
+        ),
+    ]
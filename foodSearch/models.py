@@ -1,4 +1,5 @@
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
 from  django.contrib.auth.models import User
 
 
@@ -18,18 +19,42 @@ class Product(models.Model):
     sugars_100g = models.FloatField(null=True)
     sodium_100g = models.FloatField(null=True)
     salt_100g = models.FloatField(null=True)
+    updated_at = models.DateTimeField('Mise à jour', auto_now=True, db_index=True)
+    # hash of fields and categories loaded by fill_db, to skip unchanged products
+    content_hash = models.CharField('Empreinte', max_length=40, blank=True, default='')
+    # filled by a database trigger with PostgreSQL (see migration 0013)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return self.name
 
 class Category(models.Model):
     reference = models.CharField('Référence', max_length=100, unique=True)
-    products = models.ManyToManyField(Product, related_name='categories', blank=True)
+    products = models.ManyToManyField(Product, related_name='categories', blank=True,
+                                      through='ProductCategory')
 
     def __str__(self):
         return self.reference
 
 
+class ProductCategory(models.Model):
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    # position of the category in the product's categories hierarchy,
+    # from the most generic to the most specific
+    position = models.IntegerField('Position', default=0)
+
+    class Meta:
+        db_table = 'foodSearch_category_products'
+        unique_together = ('category', 'product',)
+        indexes = [
+            models.Index(fields=['product', 'position'], name='foodSearch_category_position'),
+        ]
+
+    def __str__(self):
+        return "{} {} {}".format(self.product, self.position, self.category)
+
+
 class Favorite(models.Model):
     created_at = models.DateTimeField("date d'envoi", auto_now_add=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -43,3 +68,44 @@ class Favorite(models.Model):
 
     def __str__(self):
         return "{} {} {}".format(self.user, self.substitute, self.initial_search_product)
+
+
+class Substitute(models.Model):
+    # filled by the compute_substitutes command
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='substitutes')
+    substitute = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='substitute_for')
+    score = models.IntegerField('Catégories en commun')
+    rank = models.IntegerField('Rang')
+
+    class Meta:
+        unique_together = ('product', 'rank',)
+
+    def __str__(self):
+        return "{} {} {}".format(self.product, self.rank, self.substitute)
+
+
+class FillCheckpoint(models.Model):
+    # progress of a fill_db run, saved with each page (see fill_db --resume)
+    source = models.CharField('Source', max_length=255, unique=True)
+    first_page = models.IntegerField('Première page')
+    last_page = models.IntegerField('Dernière page', null=True)
+    page = models.IntegerField('Dernière page enregistrée')
+    failed_pages = models.TextField('Pages non chargées', blank=True, default='')
+    created = models.IntegerField('Produits ajoutés', default=0)
+    updated = models.IntegerField('Produits mis à jour', default=0)
+    unchanged = models.IntegerField('Produits inchangés', default=0)
+    elapsed = models.FloatField('Durée', default=0)
+    started_at = models.DateTimeField('Début')
+    updated_at = models.DateTimeField('Mise à jour', auto_now=True)
+
+    def __str__(self):
+        return "{} {}".format(self.source, self.page)
+
+
+class SearchCounter(models.Model):
+    # hits and misses of the search results cache, for all workers (see search_cache)
+    name = models.CharField('Nom', max_length=100, unique=True)
+    count = models.BigIntegerField('Nombre', default=0)
+
+    def __str__(self):
+        return "{} {}".format(self.name, self.count)
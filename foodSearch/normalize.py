@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""
+This module formats texts the same way for products loaded in database
+and for users queries: upper case and without accent
+
+Run it to compare its speed with the character by character NFD version:
+python -m foodSearch.normalize
+"""
+
+import timeit
+import unicodedata
+from functools import lru_cache
+
+
+def nfd_unaccent(sentence):
+    """
+    Function returning a text without accent, character by character
+    from its NFD decomposition (slow, works with any alphabet)
+    """
+    return ''.join(c for c in unicodedata.normalize('NFD', sentence)
+                   if unicodedata.category(c) != 'Mn')
+
+
+# words of queries not searched (formatted)
+STOP_WORDS = ['DE', 'DES', 'LE', 'LA', 'LES', 'AU', 'AUX', 'A']
+
+# characters before this one are all handled by the translation table
+LATIN_END = 0x250
+
+
+def latin_translation_table():
+    """
+    Function returning a str.translate table replacing each accented latin
+    character (Latin-1 Supplement and Latin Extended-A/B) by its unaccented version
+    The table is a string: character at position n replaces the character n,
+    which is faster to look up than a dictionnary
+    """
+    table = []
+    for code in range(LATIN_END):
+        character = chr(code)
+        unaccented = nfd_unaccent(character)
+        # characters made of several letters (ligatures) are left unchanged by NFD
+        table.append(unaccented if len(unaccented) == 1 else character)
+    return ''.join(table)
+
+
+LATIN_TABLE = latin_translation_table()
+LATIN_LAST_CHARACTER = chr(LATIN_END)
+
+
+def unaccent(sentence):
+    """
+    Function returning a text without accent
+    Latin characters are replaced with a translation table,
+    NFD decomposition is only used for texts with other characters
+    """
+    if sentence.isascii():
+        return sentence
+    translated = sentence.translate(LATIN_TABLE)
+    if not translated or max(translated) < LATIN_LAST_CHARACTER:
+        return translated
+    return nfd_unaccent(translated)
+
+
+@lru_cache(maxsize=100000)
+def upper_unaccent(sentence):
+    """
+    Function returning a text in upper case and without accent
+    (results are kept in memory: brands and queries are often the same)
+    """
+    return unaccent(sentence.upper())
+
+
+def benchmark(number=10000):
+    """
+    Function printing the time spent to format products names
+    with the NFD version, the translation table and the memoized version
+    """
+    names = ["Pâte à tartiner aux noisettes et au cacao", "Crème fraîche épaisse",
+             "Gâteau moelleux à l'orange", "Bière blonde d'abbaye", "Œufs de poules élevées",
+             "Cookies chocolat", "Ñoquis de patata", "Σοκολάτα γάλακτος"]
+
+    def nfd_version():
+        for name in names:
+            nfd_unaccent(name.upper())
+
+    def table_version():
+        for name in names:
+            unaccent(name.upper())
+
+    def memoized_version():
+        for name in names:
+            upper_unaccent(name)
+
+    for title, function in (("NFD character by character", nfd_version),
+                            ("translation table", table_version),
+                            ("translation table memoized", memoized_version)):
+        duration = timeit.timeit(function, number=number)
+        print("{:<30} {:8.2f} µs per name".format(
+            title, duration / (number * len(names)) * 1000000))
+
+
+if __name__ == '__main__':
+    benchmark()
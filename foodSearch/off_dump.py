@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+"""
+This module reads products of an openfoodfacts dump file
+(JSONL or CSV export, optionally compressed with gzip) one by one,
+in the format of the openfoodfacts api, so that a whole catalog
+is loaded without network and without keeping the file in memory
+"""
+
+import csv
+import gzip
+import json
+import sys
+
+FRANCE = 'en:france'
+# nutrients columns of the CSV export
+CSV_NUTRIMENTS = ('saturated-fat_100g', 'carbohydrates_100g', 'energy_100g',
+                  'sugars_100g', 'sodium_100g', 'salt_100g')
+
+
+def open_dump(path):
+    """
+    This function opens a dump file as text, uncompressing .gz files on the fly
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def read_jsonl(dump_file):
+    """
+    This generator yields products of a JSONL export (one json product per line)
+    """
+    for line in dump_file:
+        try:
+            product = json.loads(line)
+        except ValueError:
+            continue # truncated or broken line
+        if not isinstance(product, dict):
+            continue
+        if 'id' not in product and 'code' in product:
+            product['id'] = product['code']
+        yield product
+
+
+def split_tags(value):
+    """
+    This function returns the list of tags of a CSV column
+    """
+    return [tag for tag in (value or '').split(',') if tag]
+
+
+def read_csv(dump_file):
+    """
+    This generator yields products of a CSV export (tab separated)
+    converted to the format of the openfoodfacts api
+    """
+    # some columns (ingredients...) are longer than the default limit
+    csv.field_size_limit(sys.maxsize)
+    for row in csv.DictReader(dump_file, delimiter='\t', quoting=csv.QUOTE_NONE):
+        product = {
+            'id': row.get('code'),
+            'product_name': row.get('product_name'),
+            'brands': row.get('brands'),
+            'nutrition_grades': row.get('nutriscore_grade') or row.get('nutrition_grade_fr'),
+            'url': row.get('url'),
+            'image_url': row.get('image_url'),
+            'image_small_url': row.get('image_small_url'),
+            'categories_hierarchy': split_tags(row.get('categories_tags')),
+            'countries_tags': split_tags(row.get('countries_tags')),
+            'nutriments': {name: row[name] for name in CSV_NUTRIMENTS if row.get(name)},
+        }
+        # missing values are empty strings in the CSV export
+        yield {key: value for key, value in product.items() if value not in ('', None)}
+
+
+def is_french(product):
+    """
+    This function returns True if the product is sold in France
+    """
+    countries = product.get('countries_tags') or product.get('countries_hierarchy') or []
+    return FRANCE in countries
+
+
+def dump_products(path):
+    """
+    This generator yields french products of a JSONL or CSV dump file
+    """
+    name = path[:-len('.gz')] if path.endswith('.gz') else path
+    read = read_csv if name.endswith('.csv') else read_jsonl
+    with open_dump(path) as dump_file:
+        for product in read(dump_file):
+            if is_french(product):
+                yield product
+
+
+def pages(products, size):
+    """
+    This generator groups products in lists of at most size products
+    """
+    page = []
+    for product in products:
+        page.append(product)
+        if len(page) == size:
+            yield page
+            page = []
+    if page:
+        yield page
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""
+This module fetches pages of products from openfoodfacts with a pool
+of threads while a single writer saves them in database, in pages order
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+
+class RecordedPages:
+    """
+    This class serves pages of products recorded in json files
+    (page_<number>.json in a directory), instead of the openfoodfacts api
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __call__(self, page):
+        path = os.path.join(self.directory, 'page_{}.json'.format(page))
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding='utf-8') as page_file:
+            return json.load(page_file)
+
+
+class PagePipeline:
+    """
+    This class runs fetch(page) in worker threads and write(page, products)
+    in the calling thread (the only one using the database)
+    At most max_pending pages are fetched and not yet written:
+    workers wait for the writer when it is slower than them
+    """
+
+    def __init__(self, fetch, write, workers=4, max_pending=8, retries=3, retry_delay=1):
+        self.fetch = fetch
+        self.write = write
+        self.workers = workers
+        self.max_pending = max(max_pending, workers)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.written_pages = []
+        self.failed_pages = []
+
+    def fetch_with_retry(self, page):
+        """
+        This method returns products of a page, trying again after a failure
+        (None if all tries failed)
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return self.fetch(page)
+            except Exception: # network errors of any kind
+                if attempt < self.retries:
+                    time.sleep(self.retry_delay * (attempt + 1))
+        return None
+
+    def worker(self, pages, fetched, slots, stop):
+        """
+        This method fetches pages until there is none left
+        """
+        while not stop.is_set():
+            slots.acquire()
+            if stop.is_set():
+                return
+            try:
+                page = pages.get_nowait()
+            except queue.Empty:
+                slots.release()
+                return
+            fetched.put((page, self.fetch_with_retry(page)))
+
+    def run(self, first_page, last_page):
+        """
+        This method fetches and writes pages from first_page to last_page,
+        pages are written in order, failed pages are skipped
+        """
+        return self.run_pages(range(first_page, last_page + 1))
+
+    def run_pages(self, page_numbers):
+        """
+        This method fetches and writes the given pages,
+        written in the given order, failed pages are skipped
+        """
+        page_numbers = list(page_numbers)
+        pages = queue.Queue()
+        for page in page_numbers:
+            pages.put(page)
+        fetched = queue.Queue() # bounded by slots
+        slots = threading.Semaphore(self.max_pending)
+        stop = threading.Event()
+        threads = [threading.Thread(target=self.worker, args=(pages, fetched, slots, stop),
+                                    daemon=True)
+                   for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        waiting = {} # pages fetched before the previous ones
+        try:
+            for page in page_numbers:
+                while page not in waiting:
+                    fetched_page, products = fetched.get()
+                    waiting[fetched_page] = products
+                products = waiting.pop(page)
+                if products is None:
+                    self.failed_pages.append(page)
+                else:
+                    self.write(page, products)
+                    self.written_pages.append(page)
+                slots.release()
+        finally:
+            stop.set()
+            # free workers waiting for a slot
+            for _ in threads:
+                slots.release()
+        for thread in threads:
+            thread.join()
+        return self.written_pages
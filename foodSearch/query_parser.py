@@ -4,54 +4,106 @@
 This module parse products in database to get closest results of searched product
 """
 
-import unicodedata
+from django.conf import settings
 from django.db.models import Q
 from .models import Product
+from .normalize import STOP_WORDS, unaccent, upper_unaccent
+from .search_backends import get_search_backend
+from .search_index import get_search_index
 
 class QueryParser:
     """
     This class parse products in database to get closest results of searched product
     """
 
-    def __init__(self, query):
+    def __init__(self, query, fuzzy=None, index=None):
         self.query = query
         self.product_list = []
+        self.ranking = None # ordered occurences, computed once
         self.formatted_query = self.upper_no_accent(self.query)
+        self.backend = get_search_backend()
+        self.search_index = index
+        self.suggestion = None # corrected query when a word was misspelled
+        if fuzzy is None:
+            fuzzy = getattr(settings, 'SEARCH_FUZZY', False)
+        if fuzzy:
+            self.correct_query()
 
+    @property
+    def index(self):
+        """
+        In-memory search index, only loaded when needed by the search backend
+        """
+        if self.search_index is None:
+            self.search_index = get_search_index()
+        return self.search_index
 
-    def upper_no_accent(self, sentence):
+    @staticmethod
+    def upper_no_accent(sentence):
         """
         This method returns query formatted without accent and in upper case
         """
-        query_up = sentence.upper()
-        query_up_no_accent = self.no_accent(query_up)
-        return query_up_no_accent
+        return upper_unaccent(sentence)
 
     @staticmethod
     def no_accent(sentence):
         """
         This method returns query without accent
         """
-        no_accent = ''.join((c for c in unicodedata.normalize('NFD', sentence)
-                             if unicodedata.category(c) != 'Mn'))
-        return no_accent
+        return unaccent(sentence)
 
-    def get_final_list(self):
+    def correct_query(self):
+        """
+        This method replaces words of the query found nowhere in products names
+        and brands with the closest word found by the search backend (typing errors)
+        The corrected query is kept in suggestion attribute
+        """
+        words = self.formatted_query.split()
+        corrected_words = []
+        for word in words:
+            if word not in STOP_WORDS and not self.backend.known_word(self, word):
+                word = self.backend.correct(self, word) or word
+            corrected_words.append(word)
+        if corrected_words != words:
+            self.suggestion = ' '.join(corrected_words)
+            self.formatted_query = self.suggestion
+
+    def get_final_list(self, number=12):
+        """
+        This method loads in product_list attribute the 12 most relevant products:
+        first products with exactly the same name than the user query,
+        then products with the most occurences of the query words.
+        Occurences are computed once and products are fetched in a single query
+        """
+        ranked_ids = self.get_ranked_ids(number)
+        products = Product.objects.filter(Q(formatted_name=self.formatted_query)
+                                          | Q(id__in=ranked_ids))
+        exact_products = []
+        found_products = {}
+        for product in products:
+            if product.formatted_name == self.formatted_query:
+                exact_products.append(product)
+            found_products[product.id] = product
+        self.load_final_list(ranked_ids, exact_products, found_products, number)
+
+    def load_final_list(self, ranked_ids, exact_products, found_products, number=12):
         """
-        This method increments product_list attribute with the 12 most relevant products
+        This method loads in product_list attribute exact products
+        then ranked products (found_products: dictionnary of products by id)
         """
-        i = 0
-        # first get products with exactly the same name then the user query
-        if self.get_exact_query_set():
-            for product in self.get_exact_query_set():
-                self.product_list.append(product)
-        # then get a larger list if needed
-        while len(self.product_list) < 12:
-            try:
-                self.get_large_list(i)
-                i += 1
-            except:
+        self.product_list = list(exact_products)
+        for product_id in ranked_ids:
+            if len(self.product_list) >= number:
                 break
+            product = found_products.get(product_id)
+            if product is not None and product not in self.product_list:
+                self.product_list.append(product)
+
+    def get_ranked_ids(self, number):
+        """
+        This method returns ids of the first products ranked by the search backend
+        """
+        return self.backend.ranked_ids(self, number)
 
     def get_exact_query_set(self):
         """
@@ -68,32 +120,37 @@ class QueryParser:
         if product not in self.product_list:
             self.product_list.append(product)
 
+    def searched_words(self):
+        """
+        This method returns formatted words of the query, without stop words
+        """
+        return [word for word in self.formatted_query.split()
+                if word not in STOP_WORDS]
+
+    def found_ids(self):
+        """
+        This method returns ids of products matching with one of the searched words,
+        found in the search index instead of scanning the product table
+        """
+        words = self.searched_words()
+        if not words:
+            # no filter on products
+            return self.index.product_ids()
+        return self.index.candidates(words)
+
     def products_with_words(self):
         """
         This method returns products matching with each formatted words in the query
         They can be contained in the name or the brand of a product
         using formatted_name and formatted_brands coloumn of database
         """
-        # find all products with one on the word in it
-        q_objects = Q()
-        for word in self.formatted_query.split():
-            if word not in ['DE', 'DES', 'LE', 'LA', 'LES', 'AU', 'AUX', 'A']:
-                q_objects.add(Q(formatted_name__contains=word), Q.OR)
-                q_objects.add(Q(formatted_brands__contains=word), Q.OR)
-        return Product.objects.filter(q_objects).distinct()
+        return Product.objects.filter(id__in=self.found_ids())
 
     def products_infos(self):
         """
         For those products, get name and brand in a same list
         """
-        product_dict = {}
-        for product in self.products_with_words():
-            name_brand_string = product.formatted_name
-            name_brand_string += " "
-            name_brand_string += product.formatted_brands
-            list_name_brand_string = name_brand_string.split()
-            product_dict[product.id] = list_name_brand_string
-        return product_dict
+        return self.index.product_words(sorted(self.found_ids()))
 
     def occurences(self):
         """
@@ -113,4 +170,50 @@ class QueryParser:
         """
         Finally load products references in an ordered list
         """
-        return sorted(self.occurences().items(), key=lambda t: t[1], reverse=True)
+        if self.ranking is None:
+            self.ranking = sorted(self.occurences().items(), key=lambda t: t[1], reverse=True)
+        return self.ranking
+
+
+def search_many(queries, number=12):
+    """
+    This function returns the final list of each query (in the same order)
+    The search index is loaded once for all queries,
+    and all products are fetched in a single query
+    Empty queries and queries of stop words only find no products
+    """
+    index = get_search_index()
+    parsers = [QueryParser(query, index=index) for query in queries]
+    ranked_ids = {} # formatted query -> ranked ids (same ranking for same queries)
+    for parser in parsers:
+        if parser.formatted_query in ranked_ids:
+            continue
+        if parser.searched_words():
+            ranked_ids[parser.formatted_query] = parser.get_ranked_ids(number)
+        else:
+            # not ranked: all products would match
+            ranked_ids[parser.formatted_query] = None
+
+    all_ids = set()
+    for ids in ranked_ids.values():
+        all_ids.update(ids or [])
+    searched_queries = [query for query, ids in ranked_ids.items() if ids is not None]
+    if not searched_queries:
+        return parsers
+    products = Product.objects.filter(Q(formatted_name__in=searched_queries)
+                                      | Q(id__in=all_ids))
+    exact_products = {} # formatted name -> products
+    found_products = {}
+    for product in products:
+        if product.formatted_name in ranked_ids:
+            exact_products.setdefault(product.formatted_name, []).append(product)
+        found_products[product.id] = product
+
+    for parser in parsers:
+        if ranked_ids[parser.formatted_query] is None:
+            continue
+        parser.load_final_list(ranked_ids[parser.formatted_query],
+                               exact_products.get(parser.formatted_query, []),
+                               found_products,
+                               number)
+    return parsers
@@ -3,9 +3,22 @@
 """This module is called to get substitutes for the foodSearch app"""
 
 import time
-from django.db.models import Q
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils.functional import cached_property
 from django.core.paginator import Paginator
-from .models import Category, Favorite, Product
+from .category_matrix import get_category_matrix
+from .favorites import get_favorite_ids
+from .models import Product, ProductCategory, Substitute
+from .nutrients import rank_by_nutrients
+from . import substitutes_cache
+
+def nutrients_ranking():
+    """
+    Function returning True if substitutes with as many categories in common
+    are ranked by improvement of nutrients (SUBSTITUTE_RANKING setting)
+    """
+    return getattr(settings, 'SUBSTITUTE_RANKING', 'categories') == 'nutrients'
 
 def fct_sort_dict(value):
     """
@@ -15,92 +28,147 @@ def fct_sort_dict(value):
     """
     return value['nb']
 
-class ResultsParser:
+class SubstitutesRanking:
     """
-    This class parses products in database to find the most relevant substitute
-    ordered by nutriscore
+    This class ranks substitutes of a product
+    by number of categories in common with the product
     """
 
-    def __init__(self, product_id, current_user):
-        self.product = Product.objects.get(id=product_id)
-        self.current_user = current_user
-        self.all_results = self.products_same_categories()
-        self.relevant_results_queryset = self.get_results_queryset()
-        self.results_infos = self.get_results_dict_with_favorite_info()
+    def __init__(self, product, matrix=None):
+        self.product = product
+        self.matrix = matrix
 
-        if self.relevant_results_queryset.count() > 6:
-            self.paginate = True
-        else:
-            self.paginate = False
+    @cached_property
+    def found_categories(self):
+        """
+        Categories linked to this product, from the most generic to the most specific
+        """
+        return list(ProductCategory.objects
+                    .filter(product_id=self.product.id)
+                    .order_by('position', 'id')
+                    .values_list('category_id', flat=True))
 
     def products_same_categories(self):
         """
         This method gets substitutes from same catgories than the product searched.
-        Are kept only the 2 last catgegories which are the most specific
+        Are kept only the 3 last catgegories which are the most specific
         Are kept only products with a better nutriscore
         (or nustriscore A if searched product has a nutriscore A)
-        It calls a method compare_products_categories which count occurences
-        of categories between searched product and substitute
+        Occurences of categories between searched product and substitutes
+        are counted by the database in a single query,
+        or with the category matrix kept in memory if there is one
         """
-        results = []
-        loaded_products_ids = []
-        # found categories linked to this product
-        found_categories = Category.objects.filter(products__id=self.product.id)
-        nb_found_categories = found_categories.count()
-
+        if self.matrix is not None:
+            results = self.matrix.products_same_categories(self.product)
+            if results is not None:
+                return results
+        found_categories = self.found_categories
+        if not found_categories:
+            return []
         # get 3 most specifics categories of the product (last 3)
-        if nb_found_categories > 3:
-            specific_categories = found_categories[nb_found_categories-3: nb_found_categories]
-        else:
-            specific_categories = found_categories
+        specific_categories = found_categories[-3:]
 
+        compared_products = Product.objects.filter(
+            id__in=ProductCategory.objects
+            .filter(category_id__in=specific_categories)
+            .values('product_id'))
         if self.product.nutrition_grade_fr == 'a':
-            #for each category of the product asked
-            for category in specific_categories:
-                # for product in this category
-                compared_products = Product.objects.filter(categories__reference=category.reference)
-                for compared_prod in compared_products:
-                    if compared_prod.nutrition_grade_fr == self.product.nutrition_grade_fr:
-                        self.compare_products_categories(results,
-                                                         loaded_products_ids,
-                                                         compared_prod,
-                                                         found_categories)
+            compared_products = compared_products.filter(nutrition_grade_fr='a')
         else:
-            #for each category of the product asked
-            for category in specific_categories:
-                # for product in this category
-                compared_products = Product.objects.filter(categories__reference=category.reference)
-                for compared_prod in compared_products:
-                    if compared_prod.nutrition_grade_fr < self.product.nutrition_grade_fr:
-                        self.compare_products_categories(results,
-                                                         loaded_products_ids,
-                                                         compared_prod,
-                                                         found_categories)
-        return results
+            compared_products = compared_products.filter(
+                nutrition_grade_fr__lt=self.product.nutrition_grade_fr)
+
+        results = (compared_products
+                   .annotate(nb=Count('categories',
+                                      filter=Q(categories__in=found_categories),
+                                      distinct=True))
+                   .order_by('id')
+                   .values('id', 'nb'))
+        return list(results)
+
+    def ranked_substitutes(self):
+        """
+        This method returns the 24 most relevant substitutes computed from categories
+        """
+        return self.most_relevant(self.products_same_categories())
+
+    def most_relevant(self, results, number=24):
+        """
+        This method sorts results with the most occurences of categories,
+        ties are broken by improvement of nutrients with SUBSTITUTE_RANKING = 'nutrients'
+        """
+        if nutrients_ranking():
+            return rank_by_nutrients(self.product, results, number)
+        return sorted(results, key=fct_sort_dict, reverse=True)[0:number]
 
-    @staticmethod
-    def compare_products_categories(results,
-                                    loaded_products_ids,
-                                    compared_prod,
-                                    found_categories):
-        """
-        This method returns a dictionnary with substitute's id and occurences
-        of categories between searched product and substitute
-        """
-        # avoid duplication
-        if compared_prod.id not in loaded_products_ids:
-            # get common categories for each product and occurences with the searched product
-            count_same_categories = 0 #count nb of categories in common
-            common_categories = [] #id of those categories
-            for compared_category in Category.objects.filter(products__id=compared_prod.id):
-                if compared_category in found_categories:
-                    if compared_category.id not in common_categories:
-                        common_categories.append(compared_category.id)
-                        count_same_categories += 1
-            # save product as already treated, avoid duplications
-            loaded_products_ids.append(compared_prod.id)
-            # get informations in dictionnary contained in the list results
-            results.append({'id':compared_prod.id, 'nb':count_same_categories})
+
+class ResultsParser(SubstitutesRanking):
+    """
+    This class parses products in database to find the most relevant substitute
+    ordered by nutriscore
+    Each step is only computed when needed, and only products
+    of the requested page are loaded
+    """
+
+    def __init__(self, product_id, current_user, product=None):
+        if product is None:
+            product = Product.objects.get(id=product_id)
+        matrix = get_category_matrix() if getattr(settings, 'SUBSTITUTE_MATRIX', False) else None
+        super().__init__(product, matrix)
+        self.current_user = current_user
+
+    @cached_property
+    def all_results(self):
+        """
+        Substitutes with the number of categories in common with the product
+        """
+        return self.get_all_results()
+
+    @cached_property
+    def ranked_ids(self):
+        """
+        Ids of the most relevant substitutes, ordered by nutriscore
+        (the same for all users, cached for each product)
+        """
+        ranked_ids = substitutes_cache.get_ranked_ids(self.product.id, self.get_ranked_ids)
+        if not ranked_ids:
+            # without substitute, all products are shown
+            return list(Product.objects.order_by('nutrition_grade_fr', 'id')
+                        .values_list('id', flat=True))
+        return ranked_ids
+
+    @cached_property
+    def relevant_results_queryset(self):
+        """
+        Most relevant substitutes, ordered by nutriscore
+        """
+        return self.get_results_queryset()
+
+    @cached_property
+    def results_infos(self):
+        """
+        Most relevant substitutes with the information if they were saved as favorite
+        """
+        return self.get_results_dict_with_favorite_info()
+
+    @property
+    def paginate(self):
+        """
+        True if substitutes are shown on several pages
+        """
+        return len(self.ranked_ids) > 6
+
+    def get_all_results(self):
+        """
+        This method returns substitutes precomputed by compute_substitutes command
+        or computes them if the product has none
+        """
+        precomputed = Substitute.objects.filter(product=self.product).order_by('rank')
+        results = [{'id':substitute_id, 'nb':score}
+                   for substitute_id, score in precomputed.values_list('substitute_id', 'score')]
+        if results:
+            return results
+        return self.products_same_categories()
 
     def get_most_relevant_products(self):
         """
@@ -108,45 +176,184 @@ class ResultsParser:
         We chose to keep the 24 first of them
         """
         # get the 24 firsts most relevant products in an ordered queryset
-        results = sorted(self.all_results, key=fct_sort_dict, reverse=True)
-        results24 = results[0:24]
-        return results24
+        return self.most_relevant(self.all_results)
+
+    def get_ranked_ids(self):
+        """
+        This method returns ids of the products obtained with
+        get_most_relevant_products method, ordered by nutriscore
+        """
+        ids = [item['id'] for item in self.get_most_relevant_products()]
+        if not ids:
+            return []
+        grades = dict(Product.objects.filter(id__in=ids).values_list('id', 'nutrition_grade_fr'))
+        return self.order_by_grade(ids, grades)
+
+    @staticmethod
+    def order_by_grade(ids, grades):
+        """
+        This method orders the most relevant substitutes ids by nutriscore
+        (ids missing from grades were deleted and are left out)
+        """
+        if nutrients_ranking():
+            # same nutriscore: most relevant first
+            relevance = {product_id: i for i, product_id in enumerate(ids)}
+        else:
+            relevance = {product_id: product_id for product_id in ids}
+        ids = [product_id for product_id in ids if product_id in grades]
+        return sorted(ids, key=lambda product_id: (grades[product_id], relevance[product_id]))
 
     def get_results_queryset(self):
         """
-        This method get queryset of the products obtained with[]
+        This method get queryset of the products obtained with
         get_most_relevant_products method
         """
-        q_objects = Q()
-        for item in self.get_most_relevant_products():
-            q_objects.add(Q(id=item['id']), Q.OR)
-        result_queryset = Product.objects.filter(q_objects).order_by('nutrition_grade_fr')
-        return result_queryset
+        return Product.objects.filter(id__in=self.ranked_ids).order_by('nutrition_grade_fr', 'id')
 
-    def get_results_dict_with_favorite_info(self):
+    def get_results_infos(self, ids):
         """
-        This method add the information if the product was saved as favorite or not
-        in a dictionnary: {product : True/False}
+        This method loads the products of the given ids and adds the information
+        if the product was saved as favorite or not in a dictionnary: {product : saved/unsaved}
         """
-        # result in dictionnary with key=object & value=boolean(product already in favorite)
+        products = Product.objects.in_bulk(ids)
+        # favorites of the user among these products only
+        favorite_ids = get_favorite_ids(self.current_user, ids)
         results_infos = []
-        for result in self.relevant_results_queryset:
-            if self.current_user.is_authenticated:
-                if Favorite.objects.filter(substitute=result, user=self.current_user).exists():
-                    results_infos.append({result: "saved"})
-                else:
-                    results_infos.append({result: "unsaved"})
+        for product_id in ids:
+            if product_id not in products:
+                continue # deleted since substitutes were ranked
+            if product_id in favorite_ids:
+                results_infos.append({products[product_id]: "saved"})
             else:
-                results_infos.append({result: "unsaved"})
+                results_infos.append({products[product_id]: "unsaved"})
         return results_infos
 
+    def get_results_dict_with_favorite_info(self):
+        """
+        This method add the information if the product was saved as favorite or not
+        in a dictionnary: {product : saved/unsaved} for all the most relevant substitutes
+        """
+        return self.get_results_infos(self.ranked_ids)
+
     def paginator(self, page):
         """
         This method returns results per page (6 results per page)
+        only products of the page are loaded
         """
         if self.paginate:
-            paginator = Paginator(self.results_infos, 6)
+            paginator = Paginator(self.ranked_ids, 6)
             page_results = paginator.get_page(page)
+            page_results.object_list = self.get_results_infos(page_results.object_list)
         else:
-            page_results = self.results_infos
+            page_results = self.get_results_infos(self.ranked_ids)
         return page_results
+
+
+def products_same_categories_many(rankings):
+    """
+    This function returns results of products_same_categories for each ranking
+    (by product id, found_categories already loaded), with a single query
+    for the candidates of all products: categories, among categories of the products,
+    of products of their 3 most specific categories
+    """
+    specific_categories = {product_id: set(ranking.found_categories[-3:])
+                           for product_id, ranking in rankings.items()}
+    all_specific = set().union(*specific_categories.values())
+    if not all_specific:
+        return {product_id: [] for product_id in rankings}
+    all_found = set()
+    for ranking in rankings.values():
+        all_found.update(ranking.found_categories)
+    members = {} # specific category -> ids of its products
+    categories = {} # candidate id -> its categories among all_found
+    grades = {}
+    for candidate_id, category_id, grade in (
+            ProductCategory.objects
+            .filter(category_id__in=all_found,
+                    product_id__in=ProductCategory.objects
+                    .filter(category_id__in=all_specific)
+                    .values('product_id'))
+            .values_list('product_id', 'category_id', 'product__nutrition_grade_fr')):
+        categories.setdefault(candidate_id, set()).add(category_id)
+        grades[candidate_id] = grade
+        if category_id in all_specific:
+            members.setdefault(category_id, set()).add(candidate_id)
+
+    results = {}
+    for product_id, ranking in rankings.items():
+        grade = ranking.product.nutrition_grade_fr
+        found_categories = set(ranking.found_categories)
+        candidates = set()
+        for category_id in specific_categories[product_id]:
+            candidates.update(members.get(category_id, ()))
+        results[product_id] = [
+            {'id':candidate_id, 'nb':len(categories[candidate_id] & found_categories)}
+            for candidate_id in sorted(candidates)
+            if (grades[candidate_id] == 'a' if grade == 'a' else grades[candidate_id] < grade)]
+    return results
+
+
+def substitutes_many(product_ids, number=24):
+    """
+    This function returns for each product id (in the same order) the product
+    and its most relevant substitutes, ranked like ResultsParser.ranked_ids
+    Cached ranked ids, products, precomputed substitutes, categories, candidates
+    and nutriscores of substitutes are each loaded in a single query for all products
+    """
+    products = Product.objects.in_bulk(set(product_ids))
+    ranked_ids = substitutes_cache.get_many_ranked_ids(products)
+
+    parsers = {product_id: ResultsParser(product_id, None, product)
+               for product_id, product in products.items() if product_id not in ranked_ids}
+    precomputed = {}
+    for product_id, substitute_id, score in (Substitute.objects
+                                             .filter(product_id__in=parsers)
+                                             .order_by('product_id', 'rank')
+                                             .values_list('product_id', 'substitute_id', 'score')):
+        precomputed.setdefault(product_id, []).append({'id':substitute_id, 'nb':score})
+    found_categories = {}
+    for product_id, category_id in (ProductCategory.objects
+                                    .filter(product_id__in=[product_id for product_id in parsers
+                                                            if product_id not in precomputed])
+                                    .order_by('product_id', 'position', 'id')
+                                    .values_list('product_id', 'category_id')):
+        found_categories.setdefault(product_id, []).append(category_id)
+
+    unranked = {}
+    for product_id, parser in parsers.items():
+        if product_id in precomputed:
+            parser.all_results = precomputed[product_id]
+            continue
+        parser.found_categories = found_categories.get(product_id, [])
+        if parser.matrix is not None:
+            parser.all_results = parser.products_same_categories()
+        else:
+            unranked[product_id] = parser
+    if unranked:
+        for product_id, results in products_same_categories_many(unranked).items():
+            unranked[product_id].all_results = results
+
+    relevant_ids = {}
+    for product_id, parser in parsers.items():
+        relevant_ids[product_id] = [item['id'] for item in parser.get_most_relevant_products()]
+    all_ids = set()
+    for ids in relevant_ids.values():
+        all_ids.update(ids)
+    grades = dict(Product.objects.filter(id__in=all_ids).values_list('id', 'nutrition_grade_fr'))
+    computed = {product_id: ResultsParser.order_by_grade(ids, grades)
+                for product_id, ids in relevant_ids.items()}
+    if computed:
+        substitutes_cache.set_many_ranked_ids(computed)
+        ranked_ids.update(computed)
+
+    all_ids = set()
+    for ids in ranked_ids.values():
+        all_ids.update(ids[0:number])
+    substitutes = Product.objects.in_bulk(all_ids)
+    results = []
+    for product_id in product_ids:
+        ids = ranked_ids.get(product_id, [])[0:number]
+        results.append((products.get(product_id),
+                        [substitutes[substitute_id] for substitute_id in ids
+                         if substitute_id in substitutes]))
+    return results
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+"""
+This module defines the backends used by QueryParser to rank products
+matching a query. The backend is chosen with the SEARCH_BACKEND setting
+"""
+
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from .models import Product
+from .normalize import STOP_WORDS
+from .spelling import SpellChecker
+
+# shorter parts of words (elided articles like D' or L') are not searched
+MIN_FRAGMENT_LENGTH = 2
+# products whose words are compared with a misspelled word (PostgreSQL backend)
+CORRECTION_CANDIDATES = 20
+# lowest word similarity of these products (pg_trgm default 0.6 misses most typing errors)
+CORRECTION_SIMILARITY = 0.4
+
+
+class IndexSearchBackend:
+    """
+    This backend ranks products in python with occurences of query words,
+    using the in-memory search index (works with any database)
+    """
+
+    @staticmethod
+    def ranked_ids(parser, number):
+        """
+        This method returns ids of the most relevant products for the parser query
+        """
+        return [product_id for product_id, _ in parser.order_found_products()[0:number]]
+
+    @staticmethod
+    def known_word(parser, word):
+        """
+        This method returns True if a word of the vocabulary contains the query word
+        """
+        return parser.index.has_word(word) or bool(parser.index.matching_words(word))
+
+    @staticmethod
+    def correct(parser, word):
+        """
+        This method returns the word of the vocabulary the closest to a misspelled word
+        """
+        return parser.index.correct(word)
+
+
+class BM25SearchBackend(IndexSearchBackend):
+    """
+    This backend ranks products with BM25 scores computed with numpy
+    on the words x products matrix of the in-memory search index
+    """
+
+    @staticmethod
+    def ranked_ids(parser, number):
+        """
+        This method returns ids of the most relevant products for the parser query
+        """
+        words = parser.searched_words()
+        if not words:
+            return IndexSearchBackend.ranked_ids(parser, number)
+        return parser.index.bm25_ranked_ids(words, number)
+
+
+class PostgresSearchBackend:
+    """
+    This backend ranks products in database with PostgreSQL full text search,
+    on the search_vector column (formatted_name and formatted_brands)
+    Misspelled words are corrected with the pg_trgm extension, when it is installed
+    """
+
+    trigrams = None # pg_trgm installed, checked once
+
+    @staticmethod
+    def fragments(word):
+        """
+        This method returns the searched parts of a query word
+        """
+        # keep letters and digits only, other characters are tsquery operators
+        return [fragment for fragment in re.findall(r'\w+', word)
+                if len(fragment) >= MIN_FRAGMENT_LENGTH and fragment not in STOP_WORDS]
+
+    @classmethod
+    def tsquery(cls, parser):
+        """
+        This method returns a raw tsquery matching words starting like one
+        of the query words
+        """
+        words = []
+        for word in parser.searched_words():
+            words.extend(cls.fragments(word))
+        return ' | '.join('{}:*'.format(word) for word in words)
+
+    def known_word(self, parser, word):
+        """
+        This method returns True if a product has words starting like the query word
+        """
+        fragments = self.fragments(word)
+        if not fragments:
+            return True
+        query = SearchQuery(' & '.join('{}:*'.format(fragment) for fragment in fragments),
+                            config='simple', search_type='raw')
+        return Product.objects.filter(search_vector=query).exists()
+
+    @classmethod
+    def has_trigrams(cls):
+        """
+        This method returns True if the pg_trgm extension is installed
+        """
+        if cls.trigrams is None:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                cls.trigrams = cursor.fetchone() is not None
+        return cls.trigrams
+
+    def correct(self, parser, word):
+        """
+        This method returns the closest word of the products with the most similar
+        names and brands (trigram index, see migration 0018)
+        """
+        if not self.has_trigrams():
+            return None
+        text = '("formatted_name" || \' \' || "formatted_brands")'
+        with connection.cursor() as cursor:
+            cursor.execute('SET pg_trgm.word_similarity_threshold = %s', [CORRECTION_SIMILARITY])
+            cursor.execute('SELECT "formatted_name", "formatted_brands" FROM {table} '
+                           'WHERE %s <%% {text} ORDER BY %s <<-> {text}, "id" LIMIT %s'
+                           .format(table=connection.ops.quote_name(Product._meta.db_table),
+                                   text=text),
+                           [word, word, CORRECTION_CANDIDATES])
+            rows = cursor.fetchall()
+        # same distances and frequencies rules as the in-memory correction
+        checker = SpellChecker()
+        for formatted_name, formatted_brands in rows:
+            for token in '{} {}'.format(formatted_name, formatted_brands).split():
+                checker.add_word(token)
+        return checker.lookup(word)
+
+    def ranked_ids(self, parser, number):
+        """
+        This method returns ids of the most relevant products for the parser query
+        """
+        tsquery = self.tsquery(parser)
+        if not tsquery:
+            return list(Product.objects.order_by('id').values_list('id', flat=True)[0:number])
+        query = SearchQuery(tsquery, config='simple', search_type='raw')
+        products = (Product.objects
+                    .filter(search_vector=query)
+                    .annotate(rank=SearchRank(F('search_vector'), query))
+                    .order_by('-rank', 'id'))
+        return list(products.values_list('id', flat=True)[0:number])
+
+
+def get_search_backend():
+    """
+    This function returns an instance of the backend set in SEARCH_BACKEND
+    """
+    backend = getattr(settings, 'SEARCH_BACKEND',
+                      'foodSearch.search_backends.IndexSearchBackend')
+    return import_string(backend)()
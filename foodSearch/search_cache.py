@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""
+This module caches products found for a query, so that popular searches
+don't run the whole QueryParser pipeline each time
+"""
+
+import hashlib
+import threading
+import time
+
+from django.core.cache import caches
+from django.db.models import F
+
+from .catalog import get_catalog_version
+from .models import Product, SearchCounter
+
+HITS_KEY = 'search_cache_hits'
+MISSES_KEY = 'search_cache_misses'
+# seconds between two additions of a worker's counts to the shared counters
+COUNTS_FLUSH_INTERVAL = 10
+
+# counts of the worker not added to the shared counters yet
+_pending_counts = {HITS_KEY: 0, MISSES_KEY: 0}
+_pending_lock = threading.Lock()
+_last_flush = time.time()
+
+
+def get_search_cache():
+    """
+    This function returns the cache of search results
+    (bounded LRU with a timeout, see CACHES setting)
+    """
+    return caches['search']
+
+
+def results_key(formatted_query):
+    """
+    This function returns the cache key of a formatted query
+    """
+    return 'search:{}'.format(hashlib.md5(formatted_query.encode('utf-8')).hexdigest())
+
+
+def count(key):
+    """
+    This function increments a hit or miss counter of the worker,
+    added to the shared counters at most every COUNTS_FLUSH_INTERVAL seconds
+    """
+    with _pending_lock:
+        _pending_counts[key] += 1
+        if time.time() - _last_flush < COUNTS_FLUSH_INTERVAL:
+            return
+    flush_counts()
+
+
+def flush_counts():
+    """
+    This function adds the counts of the worker to the counters shared by all
+    workers, in the database (each addition is a single atomic UPDATE)
+    """
+    global _last_flush
+    with _pending_lock:
+        counts = dict(_pending_counts)
+        for key in _pending_counts:
+            _pending_counts[key] = 0
+        _last_flush = time.time()
+    for key, value in counts.items():
+        if not value:
+            continue
+        counters = SearchCounter.objects.filter(name=key)
+        if not counters.update(count=F('count') + value):
+            SearchCounter.objects.get_or_create(name=key)
+            counters.update(count=F('count') + value)
+
+
+def get_final_list(parser):
+    """
+    This function loads the final list of a QueryParser
+    from ordered products ids cached for the same formatted query
+    and the current catalog version
+    """
+    cache = get_search_cache()
+    key = results_key(parser.formatted_query)
+    version = get_catalog_version()
+    products_ids = cache.get(key, version=version)
+    if products_ids is None:
+        count(MISSES_KEY)
+        parser.get_final_list()
+        cache.set(key, [product.id for product in parser.product_list], version=version)
+    else:
+        count(HITS_KEY)
+        products = Product.objects.in_bulk(products_ids)
+        parser.product_list = [products[product_id] for product_id in products_ids
+                               if product_id in products]
+    return parser.product_list
+
+
+def get_stats():
+    """
+    This function returns hits and misses counters of the cache, for all workers
+    """
+    flush_counts()
+    counters = dict(SearchCounter.objects.values_list('name', 'count'))
+    hits = counters.get(HITS_KEY, 0)
+    misses = counters.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 3) if total else None,
+        'catalog_version': get_catalog_version(),
+    }
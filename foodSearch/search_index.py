@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+
+"""
+This module keeps in memory an inverted index of the words found in products
+names and brands, so that searching products doesn't scan the whole table
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .bm25 import BM25Matrix
+from .catalog import get_catalog_version
+from .models import Product
+from .spelling import SpellChecker
+
+# query words whose matching vocabulary words are kept (least recently used are dropped)
+MATCHING_CACHE_SIZE = 10000
+# vocabulary words are found by their substrings of at most this length
+GRAM_LENGTH = 3
+
+
+def word_grams(word):
+    """
+    This function returns the substrings of a word of 1 to GRAM_LENGTH characters
+    """
+    return {word[start:start + length]
+            for length in range(1, GRAM_LENGTH + 1)
+            for start in range(len(word) - length + 1)}
+
+
+class SearchIndex:
+    """
+    This class maps each word of formatted_name and formatted_brands columns
+    to the set of products ids containing it (posting lists),
+    and each short substring to the words containing it
+    """
+
+    def __init__(self):
+        self.postings = {} # word -> set of products ids
+        self.products = {} # product id -> words of name then brands
+        self.grams = {} # substring of at most GRAM_LENGTH characters -> words containing it
+        self.catalog_version = None # catalog version loaded in index
+        self.last_check = 0 # time of the last refresh
+        # query word -> vocabulary words containing it, bounded LRU
+        self.matching_cache = OrderedDict()
+        self.spell_checker = None # loaded the first time a word is corrected
+        self.generation = 0 # increased each time the index changes
+        self.bm25_matrix = None # (generation, matrix) loaded by BM25 ranking
+        # held by readers and while a new index is swapped in
+        self.lock = threading.RLock()
+        # held while the new index is built, without blocking readers
+        self.refresh_lock = threading.Lock()
+        # held while the BM25 matrix is built, without blocking readers
+        self.bm25_lock = threading.Lock()
+
+    def add_product(self, product_id, formatted_name, formatted_brands):
+        """
+        This method indexes words of a product name and brands
+        (a product already indexed is replaced)
+        """
+        if product_id in self.products:
+            self.remove_product(product_id)
+        self.generation += 1
+        words = "{} {}".format(formatted_name, formatted_brands).split()
+        self.products[product_id] = words
+        for word in words:
+            if word not in self.postings:
+                self.postings[word] = set()
+                for gram in word_grams(word):
+                    self.grams.setdefault(gram, set()).add(word)
+                # new word in vocabulary, substrings matches are outdated
+                self.matching_cache.clear()
+            if product_id not in self.postings[word]:
+                self.postings[word].add(product_id)
+                if self.spell_checker is not None:
+                    self.spell_checker.add_word(word)
+
+    def remove_product(self, product_id):
+        """
+        This method removes a product from posting lists
+        """
+        self.generation += 1
+        for word in self.products.pop(product_id, []):
+            posting = self.postings.get(word)
+            if posting is not None and product_id in posting:
+                posting.remove(product_id)
+                if self.spell_checker is not None:
+                    self.spell_checker.remove_word(word, 1)
+                if not posting:
+                    del self.postings[word]
+                    for gram in word_grams(word):
+                        self.grams[gram].discard(word)
+                        if not self.grams[gram]:
+                            del self.grams[gram]
+                    self.matching_cache.clear()
+
+    def build(self):
+        """
+        This method loads the whole product table in a new index,
+        swapped in when it is complete (readers keep the current one meanwhile)
+        """
+        index = SearchIndex()
+        for product_id, formatted_name, formatted_brands in Product.objects.values_list(
+                'id', 'formatted_name', 'formatted_brands'):
+            index.add_product(product_id, formatted_name, formatted_brands)
+        with self.lock:
+            self.postings = index.postings
+            self.products = index.products
+            self.grams = index.grams
+            self.matching_cache = OrderedDict()
+            self.spell_checker = None
+            self.generation += 1
+
+    def refresh(self):
+        """
+        This method reloads the index from the product table
+        """
+        self.build()
+
+    def refresh_if_needed(self):
+        """
+        This method reloads the index when the catalog version changed
+        (fill_db increases it after loading products),
+        at most once per SEARCH_INDEX_REFRESH_INTERVAL seconds
+        While a worker thread reloads it, other threads keep using the current index
+        """
+        interval = getattr(settings, 'SEARCH_INDEX_REFRESH_INTERVAL', 0)
+        if time.time() - self.last_check < interval:
+            return
+        # only the first load is waited for
+        if not self.refresh_lock.acquire(blocking=self.catalog_version is None):
+            return
+        try:
+            if time.time() - self.last_check >= interval:
+                version = get_catalog_version()
+                if version != self.catalog_version:
+                    self.build()
+                    self.catalog_version = version
+                self.last_check = time.time()
+        finally:
+            self.refresh_lock.release()
+
+    def has_word(self, word):
+        """
+        This method returns True if the word is in the vocabulary
+        """
+        return word in self.postings
+
+    def matching_words(self, word):
+        """
+        This method returns the words of the vocabulary containing the given word
+        (same behaviour as a 'contains' lookup on formatted_name and formatted_brands)
+        """
+        with self.lock:
+            if word in self.matching_cache:
+                self.matching_cache.move_to_end(word)
+                return self.matching_cache[word]
+            if len(word) <= GRAM_LENGTH:
+                tokens = sorted(self.grams.get(word, ()))
+            else:
+                # words containing each substring of the word, smallest sets first
+                sets = sorted((self.grams.get(word[start:start + GRAM_LENGTH], set())
+                               for start in range(len(word) - GRAM_LENGTH + 1)), key=len)
+                found = set(sets[0])
+                for tokens in sets[1:]:
+                    if not found:
+                        break
+                    found &= tokens
+                tokens = sorted(token for token in found if word in token)
+            self.matching_cache[word] = tokens
+            if len(self.matching_cache) > MATCHING_CACHE_SIZE:
+                self.matching_cache.popitem(last=False)
+            return tokens
+
+    def correct(self, word):
+        """
+        This method returns the word of the vocabulary the closest to a misspelled word
+        """
+        with self.lock:
+            if self.spell_checker is None:
+                self.spell_checker = SpellChecker()
+                for token, posting in self.postings.items():
+                    self.spell_checker.add_word(token, len(posting))
+            return self.spell_checker.lookup(word)
+
+    def bm25(self):
+        """
+        This method returns the BM25 matrix of the index, rebuilt if the index changed
+        The matrix is built out of the index lock, from a copy of the products:
+        while a thread builds it, other threads use the previous matrix
+        """
+        current = self.bm25_matrix
+        if current is not None and current[0] == self.generation:
+            return current[1]
+        # only the first matrix is waited for
+        if not self.bm25_lock.acquire(blocking=current is None):
+            return current[1]
+        try:
+            with self.lock:
+                current = self.bm25_matrix
+                generation = self.generation
+                if current is not None and current[0] == generation:
+                    return current[1]
+                products = dict(self.products)
+            matrix = BM25Matrix(products)
+            self.bm25_matrix = (generation, matrix)
+            return matrix
+        finally:
+            self.bm25_lock.release()
+
+    def bm25_ranked_ids(self, words, number):
+        """
+        This method returns ids of the best products for the query words with BM25
+        """
+        return self.bm25().ranked_ids(self, words, number)
+
+    def candidates(self, words):
+        """
+        This method returns ids of products with at least one of the words
+        in their name or brands
+        """
+        found = set()
+        with self.lock:
+            for word in words:
+                for token in self.matching_words(word):
+                    found |= self.postings[token]
+        return found
+
+    def product_ids(self):
+        """
+        This method returns ids of all indexed products
+        """
+        with self.lock:
+            return set(self.products)
+
+    def product_words(self, product_ids):
+        """
+        This method returns words of name then brands of products, by product id
+        """
+        with self.lock:
+            return {product_id: list(self.products[product_id]) for product_id in product_ids}
+
+
+_SEARCH_INDEX = SearchIndex()
+
+
+def get_search_index():
+    """
+    This function returns the index of the worker, refreshed if needed
+    """
+    _SEARCH_INDEX.refresh_if_needed()
+    return _SEARCH_INDEX
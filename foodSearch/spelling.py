@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+"""
+This module corrects misspelled words of a query with the words
+found in products names and brands (symmetric delete algorithm, as SymSpell)
+"""
+
+
+def distance(word1, word2, max_distance):
+    """
+    Function returning the Damerau-Levenshtein distance (optimal string alignment)
+    between 2 words, or max_distance + 1 if it is greater than max_distance
+    Only cells at less than max_distance from the diagonal are computed
+    """
+    len1, len2 = len(word1), len(word2)
+    if abs(len1 - len2) > max_distance:
+        return max_distance + 1
+    # common beginning and end don't change the distance
+    start = 0
+    while start < len1 and start < len2 and word1[start] == word2[start]:
+        start += 1
+    while len1 > start and len2 > start and word1[len1 - 1] == word2[len2 - 1]:
+        len1 -= 1
+        len2 -= 1
+    if start == len1 or start == len2:
+        return min(len1 + len2 - 2 * start, max_distance + 1)
+    word1, word2 = word1[start:len1], word2[start:len2]
+    len1, len2 = len1 - start, len2 - start
+    too_far = max_distance + 1
+    before_previous_row = None
+    previous_row = list(range(len2 + 1))
+    for i in range(1, len1 + 1):
+        row = [too_far] * (len2 + 1)
+        row[0] = i
+        char1 = word1[i - 1]
+        row_min = i
+        for j in range(max(1, i - max_distance), min(len2, i + max_distance) + 1):
+            char2 = word2[j - 1]
+            value = previous_row[j - 1] + (char1 != char2) # substitution
+            if previous_row[j] + 1 < value: # deletion
+                value = previous_row[j] + 1
+            if row[j - 1] + 1 < value: # insertion
+                value = row[j - 1] + 1
+            if (i > 1 and j > 1 and char1 == word2[j - 2] and word1[i - 2] == char2
+                    and before_previous_row[j - 2] + 1 < value): # transposition
+                value = before_previous_row[j - 2] + 1
+            row[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > max_distance:
+            return too_far
+        before_previous_row, previous_row = previous_row, row
+    return min(previous_row[len2], too_far)
+
+
+class SpellChecker:
+    """
+    This class indexes every word with its deletes (the word with up to
+    max_distance characters removed), so that looking for words close to
+    a misspelled one is only a few dictionnary lookups on its own deletes
+    """
+
+    def __init__(self, max_distance=2, prefix_length=7):
+        self.max_distance = max_distance
+        # only the beginning of words are indexed, it keeps the index small
+        self.prefix_length = prefix_length
+        self.words = {} # word -> frequency
+        self.deletes = {} # delete -> list of words
+
+    def word_deletes(self, word):
+        """
+        This method returns all the deletes of the beginning of a word,
+        ordered by number of deleted characters
+        """
+        prefix = word[0:self.prefix_length]
+        deletes = [prefix]
+        seen = {prefix}
+        edits = [prefix]
+        for _ in range(self.max_distance):
+            new_edits = []
+            for edit in edits:
+                if len(edit) > 1:
+                    for i in range(len(edit)):
+                        delete = edit[:i] + edit[i + 1:]
+                        if delete not in seen:
+                            seen.add(delete)
+                            new_edits.append(delete)
+            deletes.extend(new_edits)
+            edits = new_edits
+        return deletes
+
+    def add_word(self, word, frequency=1):
+        """
+        This method adds a word in the dictionnary or increases its frequency
+        """
+        if word in self.words:
+            self.words[word] += frequency
+            return
+        self.words[word] = frequency
+        for delete in self.word_deletes(word):
+            self.deletes.setdefault(delete, []).append(word)
+
+    def remove_word(self, word, frequency=None):
+        """
+        This method decreases the frequency of a word,
+        the word is removed from the dictionnary when it reaches 0
+        (or if no frequency is given)
+        """
+        if word not in self.words:
+            return
+        if frequency is not None and self.words[word] > frequency:
+            self.words[word] -= frequency
+            return
+        del self.words[word]
+        for delete in self.word_deletes(word):
+            words = self.deletes.get(delete)
+            if words is not None:
+                words.remove(word)
+                if not words:
+                    del self.deletes[delete]
+
+    def max_distance_for(self, word):
+        """
+        This method returns the maximum number of typing errors accepted for a word
+        (short words would be corrected in almost any other short word)
+        """
+        if len(word) < 3:
+            return 0
+        if len(word) <= 4:
+            return min(1, self.max_distance)
+        return self.max_distance
+
+    def lookup(self, word):
+        """
+        This method returns the closest word of the dictionnary
+        (the most frequent one if several words are as close), None if none is found
+        """
+        if word in self.words:
+            return word
+        max_distance = self.max_distance_for(word)
+        if not max_distance:
+            return None
+        best = None
+        checked = set()
+        for delete in self.word_deletes(word):
+            for candidate in self.deletes.get(delete, []):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                # a candidate is only kept if it is at least as close as the best one
+                candidate_distance = distance(word, candidate, max_distance)
+                if candidate_distance <= max_distance:
+                    key = (candidate_distance, -self.words[candidate], candidate)
+                    if best is None or key < best:
+                        best = key
+                        max_distance = candidate_distance
+        if best is None:
+            return None
+        return best[2]
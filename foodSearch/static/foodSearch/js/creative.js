@@ -308,6 +308,26 @@ $.ajaxSetup({
     initLoader();
   });
 
+  // suggest products names while typing a query
+  $('.searchInput').on('input', function(e){
+    let term = $(this).val();
+    if (term.length < 2){
+      return;
+    }
+    $.ajax({
+      url: "/autocomplete/",
+      type: "GET",
+      data: {'term': term},
+      success: function(data){
+        let list = $('#autocompleteList');
+        list.empty();
+        $.each(data.results, function(i, name){
+          list.append($('<option>').attr('value', name));
+        });
+      }
+    })
+  });
+
 })(jQuery); // End of use strict
 
 function createLoader(){
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""
+This module precomputes the most relevant substitutes of products
+in the Substitute table, read by ResultsParser instead of ranking them
+on each results page
+"""
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from .category_matrix import CategoryMatrix
+from .models import Product, ProductCategory, Substitute
+from .results_parser import SubstitutesRanking
+
+
+class SubstitutesBuilder:
+    """
+    This class computes and saves the 24 most relevant substitutes of products
+    """
+
+    def __init__(self):
+        self.computed = 0 # number of products computed
+        self.matrix = None # categories of products, loaded once for all products
+
+    @staticmethod
+    def affected_products(product_ids, category_ids=None):
+        """
+        This method returns ids of products whose substitutes can change
+        when the given products are added or updated: these products and products
+        with one of their categories in their 3 most specific ones (substitutes
+        are only looked for in these categories)
+        category_ids are categories of the products before and after they were
+        written (fill_db), by default their current categories
+        """
+        product_ids = set(product_ids)
+        if category_ids is None:
+            category_ids = set(ProductCategory.objects.filter(product_id__in=product_ids)
+                               .values_list('category_id', flat=True))
+        if not category_ids:
+            return product_ids
+        specific_categories = (ProductCategory.objects
+                               .filter(product_id=OuterRef('product_id'))
+                               .order_by('-position', '-id')
+                               .values('category_id')[:3])
+        sharing = (ProductCategory.objects
+                   .filter(category_id__in=category_ids)
+                   .filter(category_id__in=Subquery(specific_categories))
+                   .values_list('product_id', flat=True)
+                   .distinct())
+        return product_ids | set(sharing)
+
+    def compute_product(self, product):
+        """
+        This method replaces the substitutes saved for a product
+        """
+        ranking = SubstitutesRanking(product, self.matrix).ranked_substitutes()
+        with transaction.atomic():
+            Substitute.objects.filter(product=product).delete()
+            Substitute.objects.bulk_create([
+                Substitute(product=product, substitute_id=result['id'],
+                           score=result['nb'], rank=rank)
+                for rank, result in enumerate(ranking)])
+        self.computed += 1
+
+    def compute(self, product_ids=None, category_ids=None):
+        """
+        This method computes substitutes of the given products
+        (or of all products) and returns the number of products computed
+        """
+        products = Product.objects.order_by('id')
+        if product_ids is not None:
+            products = products.filter(id__in=self.affected_products(product_ids, category_ids))
+        self.matrix = CategoryMatrix()
+        self.matrix.build()
+        for product in products.iterator():
+            self.compute_product(product)
+        return self.computed
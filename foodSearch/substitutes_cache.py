@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+"""
+This module caches the ranked substitutes ids of each product,
+shared by all workers, so that popular results pages don't rank
+substitutes again for each request
+"""
+
+import time
+
+from django.core.cache import caches
+
+from .catalog import get_catalog_version
+
+# seconds a worker keeps the right to compute a product's substitutes
+LOCK_TIMEOUT = 30
+# seconds other workers wait for this computation when there is no stale entry
+WAIT_TIMEOUT = 2
+WAIT_STEP = 0.05
+
+
+def get_substitutes_cache():
+    """
+    This function returns the cache of ranked substitutes
+    (bounded, see CACHES setting)
+    """
+    return caches['substitutes']
+
+
+def substitutes_key(product_id):
+    """
+    This function returns the cache key of a product's substitutes
+    """
+    return 'substitutes:{}'.format(product_id)
+
+
+def lock_key(product_id):
+    """
+    This function returns the key of the lock taken to compute a product's substitutes
+    """
+    return 'substitutes_lock:{}'.format(product_id)
+
+
+def get_ranked_ids(product_id, compute):
+    """
+    This function returns the ranked substitutes ids of a product, cached
+    with the catalog version they were computed with
+    When they are missing or computed with an older catalog, only the worker
+    getting the lock calls compute(): the others serve the stale ids, or wait
+    for the new ones if there are none
+    """
+    cache = get_substitutes_cache()
+    key = substitutes_key(product_id)
+    version = get_catalog_version()
+    entry = cache.get(key) # (catalog version, ranked ids)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    if cache.add(lock_key(product_id), version, LOCK_TIMEOUT):
+        try:
+            ranked_ids = compute()
+            cache.set(key, (version, ranked_ids))
+        finally:
+            cache.delete(lock_key(product_id))
+        return ranked_ids
+
+    if entry is not None:
+        # another worker is computing them
+        return entry[1]
+    waited = 0
+    while waited < WAIT_TIMEOUT:
+        time.sleep(WAIT_STEP)
+        waited += WAIT_STEP
+        entry = cache.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+    # the worker holding the lock is too slow
+    return compute()
+
+
+def get_many_ranked_ids(product_ids):
+    """
+    This function returns the ranked substitutes ids cached for the current
+    catalog version, in a dictionnary product id -> ids (missing products are left out)
+    """
+    version = get_catalog_version()
+    entries = get_substitutes_cache().get_many([substitutes_key(product_id)
+                                                for product_id in product_ids])
+    ranked_ids = {}
+    for product_id in product_ids:
+        entry = entries.get(substitutes_key(product_id))
+        if entry is not None and entry[0] == version:
+            ranked_ids[product_id] = entry[1]
+    return ranked_ids
+
+
+def set_many_ranked_ids(ranked_ids):
+    """
+    This function caches ranked substitutes ids (dictionnary product id -> ids)
+    computed with the current catalog version
+    """
+    version = get_catalog_version()
+    get_substitutes_cache().set_many({substitutes_key(product_id): (version, ids)
+                                      for product_id, ids in ranked_ids.items()})
@@ -0,0 +1,70 @@
+"""Test autocomplete class"""
+#!/usr/bin/env python
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from ..autocomplete import Autocomplete
+from ..models import Product
+
+
+class AutocompleteTestCase(TestCase):
+    """Test autocomplete class"""
+
+    def setUp(self):
+        """"Set up testCase"""
+        Product.objects.create(name="Pâte à tartiner Nutella",
+                               formatted_name="PATE A TARTINER NUTELLA",
+                               reference='1',
+                               nutrition_grade_fr="e")
+        Product.objects.create(name="Nutella biscuits",
+                               formatted_name="NUTELLA BISCUITS",
+                               reference='2',
+                               nutrition_grade_fr="e")
+        Product.objects.create(name="Pâte à tartiner bio",
+                               formatted_name="PATE A TARTINER BIO",
+                               reference='3',
+                               nutrition_grade_fr="d")
+        self.autocomplete = Autocomplete()
+        self.autocomplete.build()
+
+    def test_suggest(self):
+        """test suggest method"""
+        self.assertEqual(self.autocomplete.suggest("PATE A"),
+                         ["Pâte à tartiner bio", "Pâte à tartiner Nutella"])
+        self.assertEqual(self.autocomplete.suggest("NUT"),
+                         ["Nutella biscuits", "Pâte à tartiner Nutella"])
+        self.assertEqual(self.autocomplete.suggest("PATE", 1), ["Pâte à tartiner bio"])
+        self.assertEqual(self.autocomplete.suggest("CHOCOLAT"), [])
+        self.assertEqual(self.autocomplete.suggest(" "), [])
+
+    def test_short_prefixes(self):
+        """test suggestions of short prefixes computed when the list is built"""
+        self.assertEqual(self.autocomplete.names.short_prefixes["P"],
+                         ["Pâte à tartiner bio", "Pâte à tartiner Nutella"])
+        self.assertEqual(self.autocomplete.names.short_prefixes["NU"],
+                         ["Nutella biscuits", "Pâte à tartiner Nutella"])
+        self.assertEqual(self.autocomplete.suggest("B"),
+                         ["Pâte à tartiner bio", "Nutella biscuits"])
+        self.assertEqual(self.autocomplete.suggest("N", 1), ["Nutella biscuits"])
+        self.assertEqual(self.autocomplete.suggest("PATE", 0), [])
+        self.assertEqual(self.autocomplete.names.cache, {})
+
+    def test_suggest_without_queries(self):
+        """test suggest method doesn't query database"""
+        with self.assertNumQueries(0):
+            self.autocomplete.suggest("TARTINER")
+
+    @override_settings(AUTOCOMPLETE_REFRESH_INTERVAL=0)
+    def test_autocomplete_view(self):
+        """test autocomplete view"""
+        response = self.client.get(reverse('foodSearch:autocomplete'), {'term': 'pâte à t'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'],
+                         ["Pâte à tartiner bio", "Pâte à tartiner Nutella"])
+
+    @override_settings(AUTOCOMPLETE_REFRESH_INTERVAL=0)
+    def test_autocomplete_view_limit(self):
+        """test autocomplete view limit kept between 1 and MAX_SUGGESTIONS"""
+        for limit, number in (("0", 1), ("-1", 1), ("1", 1), ("50", 2)):
+            response = self.client.get(reverse('foodSearch:autocomplete'),
+                                       {'term': 'pâte', 'limit': limit})
+            self.assertEqual(len(response.json()['results']), number)
@@ -0,0 +1,437 @@
+"""Test fill_db command"""
+#!/usr/bin/env python
+import gzip
+import json
+import os
+import random
+import tempfile
+import time
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from ..management.commands.fill_db import InitDB, combine_reports, fill, shard_pages
+from ..models import Category, FillCheckpoint, Product, ProductCategory, Substitute
+from ..off_dump import dump_products, pages
+from ..off_pipeline import PagePipeline, RecordedPages
+
+RECORDED_PAGES = os.path.join(os.path.dirname(__file__), 'fixtures', 'off_pages')
+
+
+def off_product(number, grade="c", categories=None, **fields):
+    """product as returned by openfoodfacts api"""
+    product = {
+        "id": "ref{}".format(number),
+        "product_name": "Prôduct {}".format(number),
+        "brands": "Brand",
+        "nutrition_grades": grade,
+        "url": "https://fr.openfoodfacts.org/produit/{}".format(number),
+        "image_url": "https://static.openfoodfacts.org/{}.jpg".format(number),
+        "image_small_url": "https://static.openfoodfacts.org/{}.small.jpg".format(number),
+        "categories_hierarchy": categories or ["en:snacks", "fr:biscuits", "en:biscuits"],
+        "nutriments": {"sugars_100g": 20, "salt_100g": "0.5"},
+    }
+    product.update(fields)
+    return product
+
+
+def deadlock():
+    """error raised by PostgreSQL when a deadlock is detected"""
+    cause = Exception("deadlock detected")
+    cause.pgcode = "40P01"
+    error = OperationalError("deadlock detected")
+    error.__cause__ = cause
+    return error
+
+
+class LoadPageTestCase(TestCase):
+    """Test pages of products written in bulk"""
+
+    def test_load_page(self):
+        """test new products with their categories"""
+        database = InitDB()
+        incomplete = off_product(3)
+        del incomplete["brands"]
+        with self.assertNumQueries(9):
+            database.load_page([off_product(1), off_product(2, "a"), incomplete])
+        self.assertEqual(Product.objects.count(), 2)
+        product = Product.objects.get(reference="ref1")
+        self.assertEqual((product.formatted_name, product.sugars_100g, product.salt_100g),
+                         ("PRODUCT 1", 20, 0.5))
+        self.assertEqual(list(ProductCategory.objects.filter(product=product)
+                              .order_by("position")
+                              .values_list("category__reference", "position")),
+                         [("en:snacks", 0), ("en:biscuits", 1)])
+        self.assertEqual(Category.objects.count(), 2)
+        self.assertEqual(database.touched_ids, set(Product.objects.values_list("id", flat=True)))
+
+    def test_update_page(self):
+        """test existing products updated"""
+        database = InitDB()
+        database.load_page([off_product(1), off_product(2)])
+        database = InitDB()
+        database.load_page([off_product(1, "b"),
+                            off_product(2, categories=["en:snacks", "en:biscuits", "en:cookies"]),
+                            # reference of another product
+                            off_product(4, id="ref1")])
+        self.assertEqual(Product.objects.count(), 2)
+        product1 = Product.objects.get(reference="ref1")
+        self.assertEqual(product1.nutrition_grade_fr, "b")
+        self.assertEqual(product1.categories.count(), 2)
+        product2 = Product.objects.get(reference="ref2")
+        self.assertEqual(list(ProductCategory.objects.filter(product=product2)
+                              .order_by("position")
+                              .values_list("category__reference", flat=True)),
+                         ["en:snacks", "en:biscuits", "en:cookies"])
+        self.assertEqual(database.touched_ids, {product1.id, product2.id})
+        self.assertEqual(database.touched_categories, set(Category.objects.values_list("id", flat=True)))
+        self.assertEqual((database.created_count, database.updated_count), (0, 2))
+
+    def test_replayed_page(self):
+        """test a page loaded again without any write"""
+        page = [off_product(1), off_product(2, "a")]
+        InitDB().load_page(page)
+        database = InitDB()
+        with self.assertNumQueries(3):
+            database.load_page(page)
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(ProductCategory.objects.count(), 4)
+        self.assertEqual((database.created_count, database.updated_count,
+                          database.unchanged_count), (0, 0, 2))
+        self.assertEqual(database.touched_ids, set())
+
+    def test_content_hash(self):
+        """test only changed products written"""
+        InitDB().load_page([off_product(1), off_product(2), off_product(3)])
+        hashes = dict(Product.objects.values_list("reference", "content_hash"))
+        self.assertEqual(len(set(hashes.values())), 3)
+        database = InitDB()
+        database.load_page([off_product(1),
+                            off_product(2, nutriments={"sugars_100g": 5}),
+                            off_product(3, categories=["en:snacks"]),
+                            off_product(4)])
+        self.assertEqual((database.created_count, database.updated_count,
+                          database.unchanged_count), (1, 2, 1))
+        changed = set(Product.objects.filter(reference__in=["ref2", "ref3", "ref4"])
+                      .values_list("id", flat=True))
+        self.assertEqual(database.touched_ids, changed)
+        self.assertEqual(Product.objects.get(reference="ref1").content_hash, hashes["ref1"])
+        self.assertNotEqual(Product.objects.get(reference="ref3").content_hash, hashes["ref3"])
+        self.assertEqual(Product.objects.get(reference="ref2").sugars_100g, 5)
+
+    def test_page_retried(self):
+        """test a page tried again after a conflict, counted once"""
+        InitDB().load_page([off_product(1)])
+        database = InitDB()
+        database.start_checkpoint("api", 1, 1)
+        save_checkpoint = database.save_checkpoint
+        conflicts = [IntegrityError(), deadlock()]
+
+        def conflicting_save(page, elapsed):
+            if conflicts:
+                raise conflicts.pop(0)
+            save_checkpoint(page, elapsed)
+
+        database.save_checkpoint = conflicting_save
+        database.write_page(1, [off_product(1), off_product(2)], time.time())
+        self.assertEqual((database.created_count, database.updated_count,
+                          database.unchanged_count), (1, 0, 1))
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_is_conflict(self):
+        """test errors of pages tried again"""
+        self.assertTrue(InitDB.is_conflict(IntegrityError()))
+        self.assertTrue(InitDB.is_conflict(deadlock()))
+        self.assertFalse(InitDB.is_conflict(OperationalError()))
+
+
+@skipUnless(connection.vendor == "postgresql", "COPY needs PostgreSQL")
+class CopyLoaderTestCase(TestCase):
+    """Test pages of products written with COPY"""
+
+    def test_load_page(self):
+        """test products and categories written like with the ORM"""
+        database = InitDB(fast_load=True)
+        incomplete = off_product(3)
+        del incomplete["brands"]
+        database.load_page([off_product(1), off_product(2, "a", nutriments={}), incomplete])
+        product = Product.objects.get(reference="ref1")
+        self.assertEqual((product.formatted_name, product.sugars_100g, product.salt_100g),
+                         ("PRODUCT 1", 20, 0.5))
+        self.assertEqual(list(ProductCategory.objects.filter(product=product)
+                              .order_by("position")
+                              .values_list("category__reference", "position")),
+                         [("en:snacks", 0), ("en:biscuits", 1)])
+        self.assertIsNone(Product.objects.get(reference="ref2").sugars_100g)
+        self.assertEqual(Category.objects.count(), 2)
+        self.assertEqual(database.touched_ids, set(Product.objects.values_list("id", flat=True)))
+        self.assertEqual(database.created_count, 2)
+
+        database = InitDB(fast_load=True)
+        database.load_page([off_product(1, "b", nutriments={"sugars_100g": 5}),
+                            off_product(2, "a", nutriments={},
+                                        categories=["en:snacks", "en:biscuits", "en:cookies"]),
+                            off_product(4, id="ref1"),
+                            off_product(5, brands="Brand\ttab\\"),
+                            off_product(6)])
+        self.assertEqual((database.created_count, database.updated_count,
+                          database.unchanged_count), (2, 2, 0))
+        product.refresh_from_db()
+        # missing nutrients are kept
+        self.assertEqual((product.nutrition_grade_fr, product.sugars_100g, product.salt_100g),
+                         ("b", 5, 0.5))
+        self.assertEqual(list(ProductCategory.objects.filter(product__reference="ref2")
+                              .order_by("position")
+                              .values_list("category__reference", flat=True)),
+                         ["en:snacks", "en:biscuits", "en:cookies"])
+        self.assertEqual(database.touched_categories, set(Category.objects.values_list("id", flat=True)))
+        self.assertEqual(Product.objects.get(reference="ref5").brands, "Brand\ttab\\")
+        self.assertFalse(Product.objects.filter(name="Prôduct 4").exists())
+        database.copy_loader.drop_staging_tables()
+
+    def test_fast_load_command(self):
+        """test recorded pages loaded with COPY"""
+        call_command("fill_db", "--fill", "--first-page", "1", "--last-page", "3",
+                     "--fast-load", "--recorded-pages", RECORDED_PAGES, stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 5)
+        self.assertEqual(Product.objects.get(reference="ref2").nutrition_grade_fr, "a")
+        self.assertTrue(Substitute.objects.filter(product__reference="ref1").exists())
+
+    def test_batched_pages(self):
+        """test pages written together, the checkpoint saved with each batch"""
+        database = InitDB(RecordedPages(RECORDED_PAGES), fast_load=True)
+        with patch("foodSearch.management.commands.fill_db.COPY_BATCH_SIZE", 3), \
+                patch.object(database.copy_loader, "load_page",
+                             wraps=database.copy_loader.load_page) as load_page:
+            database.load_datas(1, 3)
+        database.copy_loader.drop_staging_tables()
+        self.assertEqual(load_page.call_count, 2)
+        self.assertEqual(Product.objects.count(), 5)
+        self.assertEqual(Product.objects.get(reference="ref2").nutrition_grade_fr, "a")
+        self.assertEqual(FillCheckpoint.objects.get(source="api").page, 3)
+        self.assertEqual(database.report()["pages"], 3)
+
+
+class PagePipelineTestCase(TestCase):
+    """Test pages fetched by threads and written in order"""
+
+    def test_pages_order(self):
+        """test pages written in order while fetched in any order"""
+        written = []
+
+        def fetch(page):
+            time.sleep(random.random() / 100)
+            return [page]
+
+        pipeline = PagePipeline(fetch, lambda page, products: written.append(products),
+                                workers=4, max_pending=4)
+        self.assertEqual(pipeline.run(1, 30), list(range(1, 31)))
+        self.assertEqual(written, [[page] for page in range(1, 31)])
+
+    def test_retry(self):
+        """test pages fetched again after a failure, or skipped"""
+        failures = {2: 1, 3: 10}
+
+        def fetch(page):
+            if failures.get(page):
+                failures[page] -= 1
+                raise ConnectionError()
+            return [page]
+
+        written = []
+        pipeline = PagePipeline(fetch, lambda page, products: written.append(page),
+                                workers=2, retries=2, retry_delay=0)
+        pipeline.run(1, 4)
+        self.assertEqual(written, [1, 2, 4])
+        self.assertEqual(pipeline.failed_pages, [3])
+
+
+class FillCommandTestCase(TestCase):
+    """Test fill_db command with recorded pages"""
+
+    def test_fast_load_fallback(self):
+        """test pages written with the ORM when COPY is not available"""
+        database = InitDB(fast_load=True)
+        self.assertEqual(database.copy_loader is not None, connection.vendor == "postgresql")
+
+    def test_recorded_pages(self):
+        """test pages recorded in json files loaded in database"""
+        self.assertEqual(len(RecordedPages(RECORDED_PAGES)(1)), 3)
+        self.assertEqual(RecordedPages(RECORDED_PAGES)(99), [])
+        call_command("fill_db", "--fill", "--first-page", "1", "--last-page", "3",
+                     "--fetch-workers", "2", "--recorded-pages", RECORDED_PAGES,
+                     stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 5)
+        # page 3 updated product 2 after page 1 created it
+        self.assertEqual(Product.objects.get(reference="ref2").nutrition_grade_fr, "a")
+        self.assertTrue(Substitute.objects.filter(product__reference="ref1").exists())
+
+    def test_resume(self):
+        """test a run interrupted by an error continued after its last loaded page"""
+        recorded = RecordedPages(RECORDED_PAGES)
+        fetched = []
+
+        def failing_fetch(page):
+            if page == 2:
+                raise ConnectionError()
+            return recorded(page)
+
+        def fetch(page):
+            fetched.append(page)
+            return recorded(page)
+
+        with self.assertRaises(ConnectionError):
+            InitDB(failing_fetch).load_datas(1, 3)
+        checkpoint = FillCheckpoint.objects.get(source="api")
+        self.assertEqual((checkpoint.first_page, checkpoint.last_page, checkpoint.page),
+                         (1, 3, 1))
+        self.assertEqual(checkpoint.created, 3)
+
+        database = InitDB(fetch)
+        database.load_datas(1, 3, resume=True)
+        self.assertEqual(fetched, [2, 3])
+        self.assertEqual(Product.objects.count(), 5)
+        # products of page 1 still need their substitutes
+        self.assertEqual(database.touched_ids, set(Product.objects.values_list("id", flat=True)))
+        checkpoint.refresh_from_db()
+        self.assertEqual((checkpoint.page, checkpoint.created, checkpoint.updated), (3, 5, 1))
+
+        # another range starts again
+        fetched.clear()
+        InitDB(fetch).load_datas(2, 3, resume=True)
+        self.assertEqual(fetched, [2, 3])
+        self.assertEqual(FillCheckpoint.objects.get().first_page, 2)
+
+    @patch("foodSearch.off_pipeline.time.sleep")
+    def test_resume_failed_pages(self, sleep):
+        """test pages failed by the previous run fetched again when it is resumed"""
+        recorded = RecordedPages(RECORDED_PAGES)
+        fetched = []
+
+        def failing_fetch(page):
+            if page == 2:
+                raise ConnectionError()
+            return recorded(page)
+
+        def fetch(page):
+            fetched.append(page)
+            return recorded(page)
+
+        InitDB(failing_fetch).load_datas(1, 3, fetch_workers=2)
+        checkpoint = FillCheckpoint.objects.get(source="api")
+        self.assertEqual((checkpoint.page, checkpoint.failed_pages), (3, "2"))
+
+        database = InitDB(fetch)
+        database.load_datas(1, 3, fetch_workers=2, resume=True)
+        self.assertEqual(fetched, [2])
+        self.assertEqual(database.failed_pages, [])
+        checkpoint.refresh_from_db()
+        self.assertEqual((checkpoint.page, checkpoint.failed_pages), (3, ""))
+        self.assertEqual(Product.objects.count(), 5)
+
+
+class ShardsTestCase(TestCase):
+    """Test pages split in shards loaded by worker processes"""
+
+    def test_shard_pages(self):
+        """test page ranges of shards"""
+        self.assertEqual(shard_pages(0, 9, 3), [(0, 3), (4, 6), (7, 9)])
+        self.assertEqual(shard_pages(1, 2, 4), [(1, 1), (2, 2)])
+        self.assertEqual(shard_pages(5, 5, 1), [(5, 5)])
+
+    def test_shard_reports(self):
+        """test a shard with its own checkpoint and reports combined"""
+        options = {"dump": None, "first_page": 1, "last_page": 3, "fetch_workers": 0,
+                   "resume": False, "fast_load": False, "recorded_pages": RECORDED_PAGES}
+        reports = [fill(options, (1, 2)), fill(options, (3, 3))]
+        self.assertEqual(set(FillCheckpoint.objects.values_list("source", flat=True)),
+                         {"api:1-2", "api:3-3"})
+        self.assertEqual([(report["pages"], report["created"], report["updated"])
+                          for report in reports], [(2, 5, 0), (1, 0, 1)])
+        report = combine_reports(reports)
+        self.assertEqual((report["first_page"], report["last_page"], report["created"],
+                          report["updated"], report["failed_pages"]), (1, 3, 5, 1, []))
+        self.assertEqual(report["touched_ids"], set(Product.objects.values_list("id", flat=True)))
+
+
+@skipUnless(connection.vendor == "postgresql", "SQLite doesn't support concurrent writers")
+class WorkersTestCase(TransactionTestCase):
+    """Test pages loaded by several processes"""
+
+    def test_workers(self):
+        """test shards loaded at the same time"""
+        out = StringIO()
+        call_command("fill_db", "--fill", "--first-page", "1", "--last-page", "3",
+                     "--workers", "3", "--recorded-pages", RECORDED_PAGES, stdout=out)
+        self.assertEqual(Product.objects.count(), 5)
+        self.assertEqual(Category.objects.filter(reference="en:snacks").count(), 1)
+        self.assertEqual(out.getvalue().count("pages/s"), 3)
+        self.assertTrue(Substitute.objects.filter(product__reference="ref1").exists())
+
+
+class DumpTestCase(TestCase):
+    """Test products loaded from openfoodfacts dump files"""
+
+    def setUp(self):
+        """"Set up testCase"""
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        """path of a file in the temporary directory"""
+        return os.path.join(self.directory.name, name)
+
+    def test_jsonl_dump(self):
+        """test french products of a gzip JSONL dump"""
+        products = [off_product(1, countries_tags=["en:france"]),
+                    off_product(2, countries_tags=["en:belgium"]),
+                    off_product(3, countries_tags=["en:belgium", "en:france"])]
+        del products[2]["id"]
+        products[2]["code"] = "ref3"
+        with gzip.open(self.path("products.jsonl.gz"), "wt", encoding="utf-8") as dump_file:
+            for product in products:
+                dump_file.write(json.dumps(product) + "\n")
+            dump_file.write('{"truncated\n')
+        found = dump_products(self.path("products.jsonl.gz"))
+        self.assertEqual([product["id"] for product in found], ["ref1", "ref3"])
+        # the reader depends on the file extension only
+        os.mkdir(self.path("csv_exports"))
+        os.rename(self.path("products.jsonl.gz"), self.path("csv_exports/products.jsonl.gz"))
+        found = dump_products(self.path("csv_exports/products.jsonl.gz"))
+        self.assertEqual([product["id"] for product in found], ["ref1", "ref3"])
+        os.rename(self.path("csv_exports/products.jsonl.gz"), self.path("products.jsonl.gz"))
+
+        call_command("fill_db", "--fill", "--dump", self.path("products.jsonl.gz"),
+                     stdout=StringIO())
+        self.assertEqual(sorted(Product.objects.values_list("reference", flat=True)),
+                         ["ref1", "ref3"])
+
+    def test_csv_dump(self):
+        """test french products of a CSV dump"""
+        columns = ["code", "url", "product_name", "brands", "categories_tags",
+                   "countries_tags", "nutriscore_grade", "image_url", "image_small_url",
+                   "sugars_100g", "salt_100g"]
+        rows = [["ref1", "https://fr.openfoodfacts.org/produit/1", "Prôduct 1", "Brand",
+                 "en:snacks,en:biscuits", "en:france", "c", "https://static.openfoodfacts.org/1.jpg",
+                 "https://static.openfoodfacts.org/1.small.jpg", "20", ""],
+                ["ref2", "https://fr.openfoodfacts.org/produit/2", "", "Brand",
+                 "en:snacks", "en:france", "c", "https://static.openfoodfacts.org/2.jpg",
+                 "https://static.openfoodfacts.org/2.small.jpg", "", ""]]
+        with open(self.path("products.csv"), "w", encoding="utf-8") as dump_file:
+            for row in [columns] + rows:
+                dump_file.write("\t".join(row) + "\n")
+        database = InitDB()
+        database.load_dump(self.path("products.csv"))
+        self.assertEqual((database.initial_page, database.last_page), (1, 1))
+        product = Product.objects.get()
+        self.assertEqual((product.reference, product.sugars_100g, product.salt_100g),
+                         ("ref1", 20, None))
+        self.assertEqual(list(product.categories.order_by("productcategory__position")
+                              .values_list("reference", flat=True)),
+                         ["en:snacks", "en:biscuits"])
+
+    def test_pages(self):
+        """test products grouped in pages"""
+        self.assertEqual(list(pages(iter(range(5)), 2)), [[0, 1], [2, 3], [4]])
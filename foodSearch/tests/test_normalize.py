@@ -0,0 +1,30 @@
+"""Test normalize module"""
+#!/usr/bin/env python
+from django.test import SimpleTestCase
+from ..normalize import nfd_unaccent, unaccent, upper_unaccent
+
+
+class NormalizeTestCase(SimpleTestCase):
+    """Test normalize module"""
+
+    def test_unaccent(self):
+        """test unaccent function"""
+        self.assertEqual(unaccent("Pâte à tartiner"), "Pate a tartiner")
+        self.assertEqual(unaccent("Œufs"), "Œufs")
+        self.assertEqual(unaccent("Σοκολάτα"), "Σοκολατα")
+        self.assertEqual(unaccent("crème"), "creme") # already decomposed
+        self.assertEqual(unaccent(""), "")
+
+    def test_unaccent_same_as_nfd(self):
+        """test unaccent function gives the same results as NFD decomposition"""
+        for code in range(0x2000):
+            character = chr(code)
+            for sentence in (character, "é" + character, character + "́"):
+                self.assertEqual(unaccent(sentence), nfd_unaccent(sentence))
+
+    def test_upper_unaccent(self):
+        """test upper_unaccent function"""
+        self.assertEqual(upper_unaccent("Crème fraîche épaisse"), "CREME FRAICHE EPAISSE")
+        self.assertEqual(upper_unaccent("Sécond"), "SECOND")
+        self.assertEqual(upper_unaccent("Sécond"), "SECOND") # memoized
+        self.assertGreater(upper_unaccent.cache_info().hits, 0)
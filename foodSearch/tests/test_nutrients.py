@@ -0,0 +1,62 @@
+"""Test nutrients ranking"""
+#!/usr/bin/env python
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase, override_settings
+from ..models import Category, Product
+from ..nutrients import improvement_scores, rank_by_nutrients
+from ..results_parser import ResultsParser
+
+
+class NutrientsRankingTestCase(TestCase):
+    """Test nutrients ranking"""
+
+    def setUp(self):
+        """"Set up testCase"""
+        self.product = Product.objects.create(name="biscuit", reference="1",
+                                              nutrition_grade_fr="e",
+                                              energy_100g=2000, sugars_100g=30,
+                                              saturated_fat_100g=10, salt_100g=1)
+        # less sugar
+        self.less_sugar = Product.objects.create(name="biscuit peu sucré", reference="2",
+                                                 nutrition_grade_fr="c",
+                                                 energy_100g=2000, sugars_100g=12,
+                                                 saturated_fat_100g=10, salt_100g=1)
+        # less sugar and less saturated fat
+        self.lighter = Product.objects.create(name="biscuit léger", reference="3",
+                                              nutrition_grade_fr="c",
+                                              energy_100g=2000, sugars_100g=12,
+                                              saturated_fat_100g=4, salt_100g=1)
+        # nutrients unknown
+        self.unknown = Product.objects.create(name="biscuit inconnu", reference="4",
+                                              nutrition_grade_fr="c")
+        category = Category.objects.create(reference="en:biscuits")
+        for product in (self.product, self.unknown, self.less_sugar, self.lighter):
+            category.products.add(product)
+
+    def test_improvement_scores(self):
+        """test scores with missing nutrients"""
+        scores = improvement_scores(self.product,
+                                    [self.less_sugar.id, self.lighter.id, self.unknown.id])
+        self.assertAlmostEqual(scores[0], 18 / 90)
+        self.assertAlmostEqual(scores[1], 18 / 90 + 6 / 20)
+        self.assertEqual(scores[2], 0)
+
+    def test_rank_by_nutrients(self):
+        """test ties on categories broken by nutrients"""
+        results = [{'id':self.unknown.id, 'nb':1},
+                   {'id':self.less_sugar.id, 'nb':1},
+                   {'id':self.lighter.id, 'nb':1},
+                   {'id':self.product.id, 'nb':2}]
+        ranked = rank_by_nutrients(self.product, results, 3)
+        self.assertEqual([result['id'] for result in ranked],
+                         [self.product.id, self.lighter.id, self.less_sugar.id])
+
+    def test_results_parser(self):
+        """test ResultsParser order with each ranking"""
+        parser = ResultsParser(self.product.id, AnonymousUser())
+        self.assertEqual(parser.get_ranked_ids(),
+                         [self.less_sugar.id, self.lighter.id, self.unknown.id])
+        with override_settings(SUBSTITUTE_RANKING='nutrients'):
+            parser = ResultsParser(self.product.id, AnonymousUser())
+            self.assertEqual(parser.get_ranked_ids(),
+                             [self.lighter.id, self.less_sugar.id, self.unknown.id])
@@ -2,7 +2,7 @@
 #!/usr/bin/env python
 from django.test import TestCase
 from ..models import Product
-from ..query_parser import QueryParser
+from ..query_parser import QueryParser, search_many
 
 class FilterFoundProductsTestCase(TestCase):
     """Test Query parser class"""
@@ -38,6 +38,19 @@ class FilterFoundProductsTestCase(TestCase):
         parser = QueryParser(self.one_result_query)
         self.assertEqual(parser.upper_no_accent(self.one_result_query), 'SECOND')
 
+    def test_correct_query(self):
+        """test correct_query method with misspelled words"""
+        parser = QueryParser("sécont fake prodcut", fuzzy=True)
+        self.assertEqual(parser.suggestion, "SECOND FAKE PRODUCT")
+        self.assertEqual(parser.formatted_query, "SECOND FAKE PRODUCT")
+        parser.get_final_list()
+        self.assertEqual(parser.product_list[0].id, 32)
+        parser = QueryParser("fake product", fuzzy=True)
+        self.assertIsNone(parser.suggestion)
+        parser = QueryParser("prodcut", fuzzy=False)
+        self.assertIsNone(parser.suggestion)
+        self.assertEqual(parser.formatted_query, "PRODCUT")
+
     def test_get_exact_query_set(self):
         """test get_exact_query_set method"""
         parser = QueryParser(self.query_name_brands)
@@ -67,6 +80,17 @@ class FilterFoundProductsTestCase(TestCase):
         self.assertEqual(parser.product_list[0].id, 33)
         self.assertEqual(len(parser.product_list), 3)
 
+    def test_get_final_list_single_query(self):
+        """test get_final_list method fetching ordered products in one query"""
+        parser = QueryParser(self.query_name_brands)
+        parser.index.refresh() # index loaded before counting queries
+        with self.assertNumQueries(1):
+            parser.get_final_list()
+        self.assertEqual([product.id for product in parser.product_list], [31, 32, 33])
+        parser = QueryParser(self.exact_query)
+        parser.get_final_list()
+        self.assertEqual([product.id for product in parser.product_list], [33, 31, 32])
+
     def test_products_with_words(self):
         """test products_with_words method"""
         parser = QueryParser(self.query_name)
@@ -116,3 +140,25 @@ class FilterFoundProductsTestCase(TestCase):
         self.assertEqual(parser.order_found_products()[2], (33, 1))
         parser = QueryParser(self.one_result_query)
         self.assertEqual(parser.order_found_products()[0], (32, 1))
+
+    def test_search_many(self):
+        """test search_many function, same lists as get_final_list in one products query"""
+        queries = [self.exact_query, self.query_name, self.one_result_query, self.exact_query]
+        expected_lists = []
+        for query in queries:
+            parser = QueryParser(query)
+            parser.get_final_list()
+            expected_lists.append(parser.product_list)
+        parser.index.refresh() # index loaded before counting queries
+        with self.assertNumQueries(2): # index refresh and products
+            parsers = search_many(queries)
+        self.assertEqual([parser.product_list for parser in parsers], expected_lists)
+
+    def test_search_many_empty_queries(self):
+        """test search_many function with queries of no searched words"""
+        parsers = search_many(["", "  ", "la de", self.query_name])
+        self.assertEqual([parser.product_list for parser in parsers[0:3]], [[], [], []])
+        self.assertNotEqual(parsers[3].product_list, [])
+        with self.assertNumQueries(1): # catalog version, no products
+            parsers = search_many(["", "Les"])
+        self.assertEqual([parser.product_list for parser in parsers], [[], []])
@@ -1,8 +1,15 @@
 """Test Results parser class"""
 #!/usr/bin/env python
-from django.test import TestCase
-from ..models import Category, Product, Favorite, User
-from ..results_parser import ResultsParser
+from io import StringIO
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from ..category_matrix import CategoryMatrix
+from ..favorites import get_favorite_ids
+from ..models import Category, Product, ProductCategory, Favorite, Substitute, User
+from ..results_parser import (ResultsParser, SubstitutesRanking, products_same_categories_many,
+                              substitutes_many)
+from ..substitutes import SubstitutesBuilder
 
 
 class FilterFoundSubstitutesTestCase(TestCase):
@@ -225,3 +232,179 @@ class FilterFoundSubstitutesTestCase(TestCase):
                                 initial_search_product=query_prod)
         parser = ResultsParser(query_prod.id, current_user)
         self.assertEqual(parser.paginator(1)[0], {prod3:"unsaved"})
+
+    def test_compute_substitutes(self):
+        """test substitutes precomputed by compute_substitutes command"""
+        query_prod = Product.objects.get(reference="1")
+        current_user = User.objects.get(username="usertest")
+        live_parser = ResultsParser(query_prod.id, current_user)
+        call_command('compute_substitutes', stdout=StringIO())
+        self.assertEqual(Substitute.objects.filter(product=query_prod).count(), 6)
+        parser = ResultsParser(query_prod.id, current_user)
+        with self.assertNumQueries(1):
+            results = parser.get_all_results()
+        self.assertEqual(results, live_parser.get_most_relevant_products())
+        self.assertEqual(parser.results_infos, live_parser.results_infos)
+
+    def test_compute_substitutes_incremental(self):
+        """test substitutes computed only for products sharing a category"""
+        query_prod = Product.objects.get(reference="1")
+        prod5 = Product.objects.get(reference="5")
+        builder = SubstitutesBuilder()
+        self.assertEqual(builder.affected_products([prod5.id]), {prod5.id})
+        builder.compute([prod5.id])
+        self.assertFalse(Substitute.objects.filter(product=query_prod).exists())
+        prod3 = Product.objects.get(reference="3")
+        self.assertIn(query_prod.id, builder.affected_products([prod3.id]))
+        builder.compute([prod3.id])
+        self.assertEqual(Substitute.objects.get(product=query_prod, rank=5).substitute, prod3)
+
+    def test_affected_products_specific_categories(self):
+        """test products affected only through their 3 most specific categories"""
+        query_prod = Product.objects.get(reference="1")
+        query_prod_2 = Product.objects.get(reference="10")
+        builder = SubstitutesBuilder()
+        # categories of a product before it was moved out of them
+        generic = Category.objects.get(reference="en:biscuits-and-cakes")
+        affected = builder.affected_products([], {generic.id})
+        self.assertIn(query_prod_2.id, affected)
+        self.assertNotIn(query_prod.id, affected)
+        specific = Category.objects.get(reference="en:desserts")
+        self.assertIn(query_prod.id, builder.affected_products([], {specific.id}))
+
+    def test_products_same_categories_queries(self):
+        """test occurences of categories are counted in a single query"""
+        query_prod = Product.objects.get(reference="1")
+        prod3 = Product.objects.get(reference="3")
+        prod4 = Product.objects.get(reference="4")
+        parser = SubstitutesRanking(query_prod)
+        with self.assertNumQueries(2):
+            results = parser.products_same_categories()
+        self.assertEqual(results[0:2], [{'id':prod3.id, 'nb':1}, {'id':prod4.id, 'nb':5}])
+        # a product with nutriscore A is compared with products with nutriscore A
+        prod3.nutrition_grade_fr = 'a'
+        prod3.save()
+        prod4.nutrition_grade_fr = 'a'
+        prod4.save()
+        self.assertEqual(SubstitutesRanking(prod3).products_same_categories(),
+                         [{'id':prod3.id, 'nb':2}, {'id':prod4.id, 'nb':1}])
+
+    def test_category_matrix(self):
+        """test substitutes found with the category matrix"""
+        matrix = CategoryMatrix()
+        matrix.build()
+        for product in Product.objects.all():
+            with self.assertNumQueries(0):
+                results = matrix.products_same_categories(product)
+            self.assertEqual(results, SubstitutesRanking(product).products_same_categories())
+
+    @override_settings(SUBSTITUTE_MATRIX=True, SUBSTITUTE_MATRIX_REFRESH_INTERVAL=0)
+    def test_results_with_category_matrix(self):
+        """test ResultsParser with the category matrix"""
+        query_prod = Product.objects.get(reference="1")
+        current_user = User.objects.get(username="usertest")
+        parser = ResultsParser(query_prod.id, current_user)
+        self.assertIsNotNone(parser.matrix)
+        ids = [elt['id'] for elt in parser.get_most_relevant_products()]
+        self.assertEqual(ids, [Product.objects.get(reference=ref).id
+                               for ref in ("4", "6", "7", "8", "9", "3")])
+
+    def test_favorite_info_queries(self):
+        """test favorites of the user are loaded in a single query"""
+        query_prod = Product.objects.get(reference="1")
+        prod4 = Product.objects.get(reference="4")
+        current_user = User.objects.get(username="usertest")
+        Favorite.objects.create(user=current_user,
+                                substitute=prod4,
+                                initial_search_product=query_prod)
+        parser = ResultsParser(query_prod.id, current_user)
+        parser.get_results_dict_with_favorite_info()
+        # products in one query, favorites among these products in one query
+        with self.assertNumQueries(2):
+            results_infos = parser.get_results_dict_with_favorite_info()
+        self.assertEqual(results_infos[1], {prod4: "saved"})
+        self.assertEqual(get_favorite_ids(current_user), {prod4.id})
+        self.assertEqual(get_favorite_ids(current_user, [query_prod.id]), set())
+        with self.assertNumQueries(0):
+            self.assertEqual(get_favorite_ids(current_user, []), set())
+        self.assertEqual(get_favorite_ids(AnonymousUser()), set())
+
+    def test_lazy_paginator(self):
+        """test only products of the requested page are loaded"""
+        query_prod = Product.objects.get(reference="1")
+        current_user = User.objects.get(username="usertest")
+        for i in range(4):
+            product = Product.objects.create(name="tarte {}".format(i),
+                                             reference="tarte{}".format(i),
+                                             nutrition_grade_fr="C",
+                                             formatted_name="x",
+                                             brands="x",
+                                             formatted_brands="x")
+            Category.objects.get(reference="en:sweet-pies").products.add(product)
+        with self.assertNumQueries(1):
+            parser = ResultsParser(query_prod.id, current_user)
+        self.assertEqual(len(parser.ranked_ids), 10)
+        self.assertEqual(parser.paginate, True)
+        parser.paginator(1)
+        # products of the page, favorites are cached
+        with self.assertNumQueries(2):
+            page = parser.paginator(2)
+        self.assertEqual(page.paginator.num_pages, 2)
+        self.assertEqual([list(result)[0].name for result in page],
+                         ["tarte 0", "tarte 1", "tarte 2", "tarte 3"])
+
+    def test_specific_categories_position(self):
+        """test the most specific categories are the last ones in the product's hierarchy"""
+        prod3 = Product.objects.get(reference="3")
+        product = Product.objects.create(name="crème dessert",
+                                         reference="11",
+                                         nutrition_grade_fr="E",
+                                         formatted_name="x",
+                                         brands="x",
+                                         formatted_brands="x")
+        # linked in another order than the hierarchy
+        Category.objects.get(reference="en:dairy-desserts").products.add(
+            product, through_defaults={'position': 3})
+        for position, reference in enumerate(["en:biscuits-and-cakes", "en:cakes", "en:pies"]):
+            Category.objects.get(reference=reference).products.add(
+                product, through_defaults={'position': position})
+        self.assertEqual(
+            list(ProductCategory.objects.filter(product=product).order_by('-position')
+                 .values_list('category__reference', flat=True)[0:3]),
+            ["en:dairy-desserts", "en:pies", "en:cakes"])
+        results = SubstitutesRanking(product).products_same_categories()
+        self.assertIn({'id':prod3.id, 'nb':1}, results)
+        matrix = CategoryMatrix()
+        matrix.build()
+        self.assertEqual(matrix.products_same_categories(product), results)
+
+    def test_products_same_categories_many(self):
+        """test candidates of many products found in one query, like for each product"""
+        rankings = {product.id: SubstitutesRanking(product)
+                    for product in Product.objects.order_by('id')}
+        for ranking in rankings.values():
+            ranking.found_categories # loaded before counting queries
+        with self.assertNumQueries(1):
+            results = products_same_categories_many(rankings)
+        for product_id, ranking in rankings.items():
+            self.assertEqual(results[product_id], ranking.products_same_categories())
+
+    def test_substitutes_many(self):
+        """test substitutes of many products ranked like ResultsParser"""
+        current_user = User.objects.get(username="usertest")
+        products = list(Product.objects.order_by('id'))
+        SubstitutesBuilder().compute_product(products[0])
+        ids = [product.id for product in products] + [0]
+        results = substitutes_many(ids)
+        self.assertEqual(len(results), len(ids))
+        self.assertEqual(results[-1], (None, []))
+        for product, (found, substitutes) in zip(products, results):
+            self.assertEqual(found, product)
+            parser = ResultsParser(product.id, current_user)
+            self.assertEqual([substitute.id for substitute in substitutes],
+                             parser.get_ranked_ids())
+        # ranked ids cached for the next batch:
+        # products, catalog version, cached ids and substitutes queries
+        with self.assertNumQueries(4):
+            self.assertEqual(substitutes_many(ids, 1),
+                             [(found, substitutes[0:1]) for found, substitutes in results])
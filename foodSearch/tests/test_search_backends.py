@@ -0,0 +1,109 @@
+"""Test search backends"""
+#!/usr/bin/env python
+from unittest import skipUnless
+from django.db import connection
+from django.test import TestCase, override_settings
+from ..models import Product
+from ..query_parser import QueryParser
+from ..search_backends import BM25SearchBackend, IndexSearchBackend, PostgresSearchBackend
+
+
+class SearchBackendsTestCase(TestCase):
+    """Test search backends"""
+
+    def setUp(self):
+        """"Set up testCase"""
+        Product.objects.create(id=31,
+                               name="Fàke product for db",
+                               formatted_name="FAKE PRODUCT FOR DB",
+                               brands="brand fake",
+                               formatted_brands="BRAND FAKE",
+                               reference='1')
+        Product.objects.create(id=32,
+                               name="Second fake prôduct",
+                               formatted_name="SECOND FAKE PRODUCT",
+                               brands="the wrong one",
+                               formatted_brands="THE WRONG ONE",
+                               reference='2')
+        Product.objects.create(id=33, name="product",
+                               formatted_name="PRODUCT",
+                               brands="not bad",
+                               formatted_brands="NOT BAD",
+                               reference='3')
+
+    @override_settings(SEARCH_BACKEND='foodSearch.search_backends.IndexSearchBackend')
+    def test_index_backend(self):
+        """test IndexSearchBackend ranking"""
+        parser = QueryParser("fake prôduct brand")
+        self.assertIsInstance(parser.backend, IndexSearchBackend)
+        self.assertEqual(parser.backend.ranked_ids(parser, 12), [31, 32, 33])
+
+    def test_postgres_tsquery(self):
+        """test tsquery built from the query words"""
+        parser = QueryParser("la pâte d'amande")
+        self.assertEqual(PostgresSearchBackend.tsquery(parser), "PATE:* | AMANDE:*")
+        parser = QueryParser("l'huile de-la noix")
+        self.assertEqual(PostgresSearchBackend.tsquery(parser), "HUILE:* | NOIX:*")
+
+    @skipUnless(connection.vendor == 'postgresql', "PostgreSQL full text search")
+    @override_settings(SEARCH_BACKEND='foodSearch.search_backends.PostgresSearchBackend')
+    def test_postgres_backend(self):
+        """test PostgresSearchBackend ranking"""
+        parser = QueryParser("fake prôduct brand")
+        self.assertIsInstance(parser.backend, PostgresSearchBackend)
+        self.assertEqual(parser.backend.ranked_ids(parser, 12), [31, 32, 33])
+        parser = QueryParser("wrong")
+        parser.get_final_list()
+        self.assertEqual([product.id for product in parser.product_list], [32])
+
+    @skipUnless(connection.vendor == 'postgresql', "PostgreSQL full text search")
+    @override_settings(SEARCH_BACKEND='foodSearch.search_backends.PostgresSearchBackend')
+    def test_postgres_correction(self):
+        """test misspelled words corrected in database, without the in-memory index"""
+        parser = QueryParser("fake prod", fuzzy=True)
+        self.assertIsNone(parser.suggestion)
+        parser = QueryParser("fake prodcut", fuzzy=True)
+        self.assertIsNone(parser.search_index)
+        if not PostgresSearchBackend.has_trigrams():
+            self.skipTest("pg_trgm is not installed")
+        self.assertEqual(parser.suggestion, "FAKE PRODUCT")
+
+
+class BM25SearchBackendTestCase(TestCase):
+    """Test BM25 search backend"""
+
+    def setUp(self):
+        """"Set up testCase"""
+        for i in range(5):
+            Product.objects.create(id=40 + i,
+                                   name="chocolat bio {}".format(i),
+                                   formatted_name="CHOCOLAT BIO {}".format(i),
+                                   brands="marque",
+                                   formatted_brands="MARQUE",
+                                   reference=str(40 + i))
+        Product.objects.create(id=50,
+                               name="chocolat noisette",
+                               formatted_name="CHOCOLAT NOISETTE",
+                               brands="marque",
+                               formatted_brands="MARQUE",
+                               reference='50')
+
+    @override_settings(SEARCH_BACKEND='foodSearch.search_backends.BM25SearchBackend')
+    def test_rare_words_first(self):
+        """test BM25SearchBackend ranking, rare words weigh more than common words"""
+        parser = QueryParser("chocolat noisette bio")
+        self.assertIsInstance(parser.backend, BM25SearchBackend)
+        self.assertEqual(parser.backend.ranked_ids(parser, 3), [50, 40, 41])
+        # occurences count rank them equally
+        parser = QueryParser("chocolat noisette bio", fuzzy=False)
+        self.assertEqual(IndexSearchBackend.ranked_ids(parser, 3), [40, 41, 42])
+
+    @override_settings(SEARCH_BACKEND='foodSearch.search_backends.BM25SearchBackend')
+    def test_final_list(self):
+        """test final list with BM25SearchBackend"""
+        parser = QueryParser("noisette")
+        parser.get_final_list()
+        self.assertEqual([product.id for product in parser.product_list], [50])
+        parser = QueryParser("bio 3")
+        parser.get_final_list()
+        self.assertEqual(parser.product_list[0].id, 43)
@@ -0,0 +1,87 @@
+"""Test search results cache"""
+#!/usr/bin/env python
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django.db.models import F
+from ..catalog import bump_catalog_version, get_catalog_version
+from ..models import Product, SearchCounter
+from ..query_parser import QueryParser
+from .. import search_cache
+
+
+class SearchCacheTestCase(TestCase):
+    """Test search results cache"""
+
+    def setUp(self):
+        """"Set up testCase"""
+        search_cache.get_search_cache().clear()
+        # counts of previous tests
+        search_cache.flush_counts()
+        Product.objects.create(id=31,
+                               name="Fàke product for db",
+                               formatted_name="FAKE PRODUCT FOR DB",
+                               brands="brand fake",
+                               formatted_brands="BRAND FAKE",
+                               reference='1')
+        Product.objects.create(id=32,
+                               name="Second fake prôduct",
+                               formatted_name="SECOND FAKE PRODUCT",
+                               brands="the wrong one",
+                               formatted_brands="THE WRONG ONE",
+                               reference='2')
+
+    def test_get_final_list(self):
+        """test get_final_list function with a miss then a hit"""
+        parser = QueryParser("fake prôduct")
+        products = search_cache.get_final_list(parser)
+        self.assertEqual([product.id for product in products], [31, 32])
+        Product.objects.create(id=33, name="product",
+                               formatted_name="PRODUCT",
+                               brands="not bad",
+                               formatted_brands="NOT BAD",
+                               reference='3')
+        # same formatted query, cached results
+        parser = QueryParser("Fake Product")
+        products = search_cache.get_final_list(parser)
+        self.assertEqual([product.id for product in products], [31, 32])
+        self.assertEqual(parser.product_list, products)
+        stats = search_cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_catalog_version(self):
+        """test cached results dropped when catalog version changes"""
+        version = get_catalog_version()
+        search_cache.get_final_list(QueryParser("fake"))
+        Product.objects.create(id=33, name="fake",
+                               formatted_name="FAKE",
+                               brands="not bad",
+                               formatted_brands="NOT BAD",
+                               reference='3')
+        self.assertEqual(bump_catalog_version(), version + 1)
+        products = search_cache.get_final_list(QueryParser("fake"))
+        self.assertEqual([product.id for product in products], [33, 31, 32])
+        self.assertEqual(search_cache.get_stats()['misses'], 2)
+
+    def test_search_stats_view(self):
+        """test search_stats view, only for staff users"""
+        response = self.client.get(reverse('foodSearch:search_stats'))
+        self.assertEqual(response.status_code, 404)
+        User.objects.create_user(username='staff', password='password', is_staff=True)
+        self.client.login(username='staff', password='password')
+        self.client.get(reverse('foodSearch:search'), {'query': "fake"})
+        self.client.get(reverse('foodSearch:search'), {'query': "FAKE"})
+        response = self.client.get(reverse('foodSearch:search_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['hits'], 1)
+        self.assertEqual(response.json()['misses'], 1)
+        self.assertEqual(response.json()['hit_ratio'], 0.5)
+
+    def test_shared_counters(self):
+        """test counters kept out of the search results LRU, for all workers"""
+        search_cache.get_final_list(QueryParser("fake"))
+        search_cache.flush_counts()
+        search_cache.get_search_cache().clear()
+        # count of another worker
+        SearchCounter.objects.filter(name=search_cache.MISSES_KEY).update(count=F('count') + 2)
+        self.assertEqual(search_cache.get_stats()['misses'], 3)
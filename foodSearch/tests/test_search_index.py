@@ -0,0 +1,128 @@
+"""Test search index class"""
+#!/usr/bin/env python
+import threading
+from unittest.mock import patch
+from django.test import TestCase
+from ..catalog import bump_catalog_version
+from ..models import Product
+from ..search_index import SearchIndex
+
+class SearchIndexTestCase(TestCase):
+    """Test search index class"""
+
+    def setUp(self):
+        """"Set up testCase"""
+        Product.objects.create(id=31,
+                               name="Fàke product for db",
+                               formatted_name="FAKE PRODUCT FOR DB",
+                               brands="brand fake",
+                               formatted_brands="BRAND FAKE",
+                               reference='1')
+        Product.objects.create(id=32,
+                               name="Second fake prôduct",
+                               formatted_name="SECOND FAKE PRODUCT",
+                               brands="the wrong one",
+                               formatted_brands="THE WRONG ONE",
+                               reference='2')
+        self.index = SearchIndex()
+        self.index.build()
+
+    def test_build(self):
+        """test build method"""
+        self.assertEqual(self.index.postings['FAKE'], {31, 32})
+        self.assertEqual(self.index.postings['WRONG'], {32})
+        self.assertEqual(self.index.products[31],
+                         ["FAKE", "PRODUCT", "FOR", "DB", "BRAND", "FAKE"])
+
+    def test_candidates(self):
+        """test candidates method, words are found as in a 'contains' lookup"""
+        self.assertEqual(self.index.candidates(['WRONG']), {32})
+        self.assertEqual(self.index.candidates(['BRAN', 'SECOND']), {31, 32})
+        self.assertEqual(self.index.candidates(['NOTHING']), set())
+
+    def test_refresh_new_and_updated_products(self):
+        """test refresh method loading created or updated products only"""
+        Product.objects.create(id=33, name="product",
+                               formatted_name="PRODUCT",
+                               brands="not bad",
+                               formatted_brands="NOT BAD",
+                               reference='3')
+        product = Product.objects.get(id=32)
+        product.formatted_brands = "THE GOOD ONE"
+        product.save()
+        self.index.refresh()
+        self.assertEqual(self.index.postings['PRODUCT'], {31, 32, 33})
+        self.assertEqual(self.index.candidates(['WRONG']), set())
+        self.assertEqual(self.index.candidates(['GOOD']), {32})
+
+    def test_refresh_deleted_products(self):
+        """test refresh method when products were deleted"""
+        Product.objects.filter(id=31).delete()
+        self.index.refresh()
+        self.assertEqual(self.index.postings['FAKE'], {32})
+        self.assertNotIn('BRAND', self.index.postings)
+
+    def test_matching_words(self):
+        """test vocabulary words containing a query word, found by their substrings"""
+        self.assertEqual(self.index.matching_words('R'),
+                         ['BRAND', 'FOR', 'PRODUCT', 'WRONG'])
+        self.assertEqual(self.index.matching_words('ODUC'), ['PRODUCT'])
+        self.assertEqual(self.index.matching_words('RODUCTS'), [])
+        self.index.remove_product(32)
+        self.assertEqual(self.index.matching_words('ON'), [])
+        self.assertNotIn('ON', self.index.grams)
+
+    def test_refresh_on_catalog_version(self):
+        """test index reloaded when the catalog version changed only"""
+        self.index.refresh_if_needed()
+        Product.objects.filter(id=31).update(formatted_name="OTHER PRODUCT")
+        self.index.refresh_if_needed()
+        self.assertIn('FOR', self.index.postings)
+        bump_catalog_version()
+        self.index.refresh_if_needed()
+        self.assertNotIn('FOR', self.index.postings)
+        self.assertEqual(self.index.postings['OTHER'], {31})
+
+    def test_bm25_built_out_of_lock(self):
+        """test previous BM25 matrix used while another thread builds the new one"""
+        matrix = self.index.bm25()
+        self.assertIs(self.index.bm25(), matrix)
+        self.index.add_product(33, "FAKE BREAD", "BAKER")
+        with self.index.bm25_lock:
+            self.assertIs(self.index.bm25(), matrix)
+            self.assertEqual(self.index.bm25_ranked_ids(['BREAD', 'WRONG'], 12), [32])
+        self.assertEqual(self.index.bm25_ranked_ids(['BREAD'], 12), [33])
+
+    def test_matching_cache_bounded(self):
+        """test least recently used query words dropped from the matching cache"""
+        with patch('foodSearch.search_index.MATCHING_CACHE_SIZE', 2):
+            self.index.matching_words('FAKE')
+            self.index.matching_words('WRONG')
+            self.index.matching_words('FAKE')
+            self.index.matching_words('ONE')
+        self.assertEqual(list(self.index.matching_cache), ['FAKE', 'ONE'])
+        self.assertEqual(self.index.matching_words('WRONG'), ['WRONG'])
+
+    def test_reads_during_refresh(self):
+        """test readers waiting for a refresh changing the index"""
+        errors = []
+        stop = threading.Event()
+
+        def read():
+            while not stop.is_set():
+                try:
+                    self.index.candidates(['F'])
+                    self.index.product_ids()
+                except RuntimeError as error: # dictionary changed size during iteration
+                    errors.append(error)
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        try:
+            for number in range(200):
+                with self.index.lock:
+                    self.index.add_product(100 + number, "FOOD{}".format(number), "BRAND")
+        finally:
+            stop.set()
+            reader.join()
+        self.assertEqual(errors, [])
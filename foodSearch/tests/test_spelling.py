@@ -0,0 +1,40 @@
+"""Test spelling module"""
+#!/usr/bin/env python
+from django.test import SimpleTestCase
+from ..spelling import SpellChecker, distance
+
+
+class SpellCheckerTestCase(SimpleTestCase):
+    """Test SpellChecker class"""
+
+    def setUp(self):
+        """"Set up testCase"""
+        self.spell_checker = SpellChecker()
+        for word, frequency in (("NUTELLA", 10), ("CHOCAPIC", 3),
+                                ("CHOCOLAT", 50), ("CHOCOLATS", 2), ("THE", 5)):
+            self.spell_checker.add_word(word, frequency)
+
+    def test_distance(self):
+        """test distance function"""
+        self.assertEqual(distance("NUTELA", "NUTELLA", 2), 1)
+        self.assertEqual(distance("NUTLELA", "NUTELLA", 2), 1) # transposition
+        self.assertEqual(distance("CHOCAPIK", "CHOCAPIC", 2), 1)
+        self.assertEqual(distance("NUTELLA", "CHOCAPIC", 2), 3)
+
+    def test_lookup(self):
+        """test lookup method"""
+        self.assertEqual(self.spell_checker.lookup("NUTELA"), "NUTELLA")
+        self.assertEqual(self.spell_checker.lookup("CHOCAPIK"), "CHOCAPIC")
+        self.assertEqual(self.spell_checker.lookup("CHOCOLA"), "CHOCOLAT") # most frequent
+        self.assertEqual(self.spell_checker.lookup("NUTELLA"), "NUTELLA")
+        self.assertIsNone(self.spell_checker.lookup("BISCUIT"))
+        self.assertIsNone(self.spell_checker.lookup("TH")) # too short
+
+    def test_remove_word(self):
+        """test remove_word method"""
+        self.spell_checker.remove_word("CHOCOLAT", 49)
+        self.assertEqual(self.spell_checker.lookup("CHOCOLA"), "CHOCOLAT")
+        self.spell_checker.remove_word("CHOCOLAT", 1)
+        self.assertEqual(self.spell_checker.lookup("CHOCOLA"), "CHOCOLATS")
+        self.spell_checker.remove_word("CHOCOLATS")
+        self.assertIsNone(self.spell_checker.lookup("CHOCOLA"))
@@ -0,0 +1,70 @@
+"""Test ranked substitutes cache"""
+#!/usr/bin/env python
+from unittest import mock
+from django.test import TestCase
+from django.contrib.auth.models import AnonymousUser
+from ..catalog import bump_catalog_version, get_catalog_version
+from ..models import Category, Product
+from ..results_parser import ResultsParser
+from .. import substitutes_cache
+
+
+class SubstitutesCacheTestCase(TestCase):
+    """Test ranked substitutes cache"""
+
+    def setUp(self):
+        """"Set up testCase"""
+        substitutes_cache.get_substitutes_cache().clear()
+        self.computed = 0
+
+    def compute(self):
+        """ranking counting its calls"""
+        self.computed += 1
+        return [1, 2, 3]
+
+    def test_get_ranked_ids(self):
+        """test get_ranked_ids function with a miss, a hit and a new catalog version"""
+        self.assertEqual(substitutes_cache.get_ranked_ids(1, self.compute), [1, 2, 3])
+        self.assertEqual(substitutes_cache.get_ranked_ids(1, self.compute), [1, 2, 3])
+        self.assertEqual(self.computed, 1)
+        bump_catalog_version()
+        self.assertEqual(substitutes_cache.get_ranked_ids(1, self.compute), [1, 2, 3])
+        self.assertEqual(self.computed, 2)
+
+    def test_stale_ids(self):
+        """test stale ids are served while another worker computes them"""
+        cache = substitutes_cache.get_substitutes_cache()
+        cache.set(substitutes_cache.substitutes_key(1), (get_catalog_version() - 1, [4]))
+        cache.add(substitutes_cache.lock_key(1), 1)
+        self.assertEqual(substitutes_cache.get_ranked_ids(1, self.compute), [4])
+        self.assertEqual(self.computed, 0)
+        # lock released, the worker computes them
+        cache.delete(substitutes_cache.lock_key(1))
+        self.assertEqual(substitutes_cache.get_ranked_ids(1, self.compute), [1, 2, 3])
+        self.assertEqual(self.computed, 1)
+
+    @mock.patch.object(substitutes_cache, 'WAIT_TIMEOUT', 0.1)
+    def test_cold_key_locked(self):
+        """test a worker computes ids itself when the locking worker is too slow"""
+        cache = substitutes_cache.get_substitutes_cache()
+        cache.add(substitutes_cache.lock_key(1), 1)
+        self.assertEqual(substitutes_cache.get_ranked_ids(1, self.compute), [1, 2, 3])
+        self.assertEqual(self.computed, 1)
+
+    def test_results_parser(self):
+        """test ResultsParser ranked ids cached for the product"""
+        category = Category.objects.create(reference="en:cakes")
+        product = Product.objects.create(name="gâteau", reference="1",
+                                         nutrition_grade_fr="d")
+        substitute = Product.objects.create(name="gâteau allégé", reference="2",
+                                            nutrition_grade_fr="b")
+        category.products.add(product)
+        category.products.add(substitute)
+        self.assertEqual(ResultsParser(product.id, AnonymousUser()).ranked_ids, [substitute.id])
+        better = Product.objects.create(name="gâteau sans sucre", reference="3",
+                                        nutrition_grade_fr="a")
+        category.products.add(better)
+        self.assertEqual(ResultsParser(product.id, AnonymousUser()).ranked_ids, [substitute.id])
+        bump_catalog_version()
+        self.assertEqual(ResultsParser(product.id, AnonymousUser()).ranked_ids,
+                         [better.id, substitute.id])
@@ -5,7 +5,7 @@ from django.contrib.auth import views as auth_views
 from ..views import (
     index, legals,
     register_view, login_view,
-    search, results, detail,
+    search, search_stats, search_batch, substitutes_batch, autocomplete, results, detail,
     userpage, new_name, new_email,
     watchlist, load_favorite,
 )
@@ -48,6 +48,26 @@ class TestUrls(SimpleTestCase):
         url = reverse('foodSearch:search')
         self.assertEqual(resolve(url).func, search)
 
+    def test_search_stats_url_is_resolved(self):
+        """test search_stats_url"""
+        url = reverse('foodSearch:search_stats')
+        self.assertEqual(resolve(url).func, search_stats)
+
+    def test_search_batch_url_is_resolved(self):
+        """test search_batch_url"""
+        url = reverse('foodSearch:search_batch')
+        self.assertEqual(resolve(url).func, search_batch)
+
+    def test_substitutes_batch_url_is_resolved(self):
+        """test substitutes_batch_url"""
+        url = reverse('foodSearch:substitutes_batch')
+        self.assertEqual(resolve(url).func, substitutes_batch)
+
+    def test_autocomplete_url_is_resolved(self):
+        """test autocomplete_url"""
+        url = reverse('foodSearch:autocomplete')
+        self.assertEqual(resolve(url).func, autocomplete)
+
     def test_results_url_is_resolved(self):
         """test results_url"""
         url = reverse('foodSearch:results', args=[00000])
@@ -11,7 +11,8 @@ from django.core import mail
 
 from selenium.webdriver.firefox.webdriver import WebDriver
 
-from ..models import Favorite, Product
+from ..favorites import get_favorite_ids
+from ..models import Category, Favorite, Product
 
 class GeneralPagesTestCase(TestCase):
     """
@@ -236,6 +237,21 @@ class ProceedResearchTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'foodSearch/search.html')
         self.assertEqual(self.prod in response.context['found_products'], True)
+        self.assertEqual(response.context['suggestion'], None)
+
+    def test_search_get_misspelled(self):
+        """test search view with a misspelled query"""
+        response = self.client.get(reverse('foodSearch:search'), {'query': "Prodcut"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['suggestion'], "product")
+        self.assertEqual(self.prod in response.context['found_products'], True)
+        self.assertContains(response, "Résultats pour <strong>product</strong>")
+        self.assertContains(response, 'href="/search/?query=Prodcut&amp;exact=1"')
+        # the query as typed
+        response = self.client.get(reverse('foodSearch:search'),
+                                   {'query': "Prodcut", 'exact': "1"})
+        self.assertEqual(response.context['suggestion'], None)
+        self.assertEqual(list(response.context['found_products']), [])
 
     def test_results_get(self):
         """test result view"""
@@ -428,11 +444,13 @@ class ManageFavoritesTestCase(TransactionTestCase):
         self.assertEqual(response.status_code, 200)
         fav = Favorite.objects.filter(user=self.user2, substitute=self.product1)
         self.assertEqual(fav.exists(), True)
+        self.assertEqual(get_favorite_ids(self.user2), {self.product1.id})
         self.client.logout()
 
     def test_unsave_favorite(self):
         """tests loadfavorite view when deleting favorite"""
         self.client.login(username='Test', password='password')
+        self.assertEqual(get_favorite_ids(self.user1), {self.product1.id})
         data = {'user': self.user1.id,
                 'substitute':self.product1.id,
                 'favorite': "saved",
@@ -443,4 +461,99 @@ class ManageFavoritesTestCase(TransactionTestCase):
         self.assertEqual(response.status_code, 200)
         fav = Favorite.objects.filter(user=self.user1, substitute=self.product1)
         self.assertEqual(fav.exists(), False)
+        self.assertEqual(get_favorite_ids(self.user1), set())
         self.client.logout()
+
+
+class SearchBatchTestCase(TestCase):
+    """Tests on search_batch view"""
+
+    def setUp(self):
+        """setup tests"""
+        self.prod = Product.objects.create(id=31,
+                                           name="Fàke product for db",
+                                           formatted_name="FAKE PRODUCT FOR DB",
+                                           brands="brand fake",
+                                           formatted_brands="BRAND FAKE",
+                                           reference='1',
+                                           nutrition_grade_fr="A")
+        self.prod2 = Product.objects.create(id=32,
+                                            name="Second fake prôduct",
+                                            formatted_name="SECOND FAKE PRODUCT",
+                                            brands="the wrong one",
+                                            formatted_brands="THE WRONG ONE",
+                                            reference='2',
+                                            nutrition_grade_fr="E")
+
+    def test_search_batch(self):
+        """test search_batch view"""
+        response = self.client.post(reverse('foodSearch:search_batch'),
+                                    data={'queries': ["second", "wrnog", "nothing"]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['query'] for result in results], ["second", "wrnog", "nothing"])
+        self.assertEqual([product['id'] for product in results[0]['products']], [32])
+        self.assertEqual(results[0]['products'][0]['results_url'], '/results/32/')
+        self.assertEqual(results[1]['suggestion'], "wrong")
+        self.assertEqual(results[2]['products'], [])
+
+    def test_search_batch_errors(self):
+        """test search_batch view with wrong requests"""
+        url = reverse('foodSearch:search_batch')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        response = self.client.post(url, data="not json", content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, data={'queries': ["x"] * 201},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class SubstitutesBatchTestCase(TestCase):
+    """Tests on substitutes_batch view"""
+
+    def setUp(self):
+        """setup tests"""
+        category = Category.objects.create(reference="en:cakes")
+        self.prod = Product.objects.create(id=31,
+                                           name="Fàke product for db",
+                                           formatted_name="FAKE PRODUCT FOR DB",
+                                           brands="brand fake",
+                                           formatted_brands="BRAND FAKE",
+                                           reference='1',
+                                           nutrition_grade_fr="a")
+        self.prod2 = Product.objects.create(id=32,
+                                            name="Second fake prôduct",
+                                            formatted_name="SECOND FAKE PRODUCT",
+                                            brands="the wrong one",
+                                            formatted_brands="THE WRONG ONE",
+                                            reference='2',
+                                            nutrition_grade_fr="e")
+        category.products.add(self.prod)
+        category.products.add(self.prod2)
+
+    def test_substitutes_batch(self):
+        """test substitutes_batch view"""
+        response = self.client.post(reverse('foodSearch:substitutes_batch'),
+                                    data={'products': [32, 31, 99]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['product'] for result in results], [32, 31, 99])
+        self.assertEqual([substitute['id'] for substitute in results[0]['substitutes']], [31])
+        self.assertEqual(results[0]['substitutes'][0]['detail_url'], '/detail/31/')
+        self.assertEqual([substitute['id'] for substitute in results[1]['substitutes']], [31])
+        self.assertEqual((results[2]['found'], results[2]['substitutes']), (False, []))
+
+    def test_substitutes_batch_errors(self):
+        """test substitutes_batch view with wrong requests"""
+        url = reverse('foodSearch:substitutes_batch')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        response = self.client.post(url, data="not json", content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, data={'products': ["31"]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, data={'products': [31] * 101},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
@@ -10,6 +10,10 @@ urlpatterns = [
     path('login/', views.login_view, name='login'),
     path('register/', views.register_view, name='register'),
     path('search/', views.search, name='search'),
+    path('search/stats/', views.search_stats, name='search_stats'),
+    path('search/batch/', views.search_batch, name='search_batch'),
+    path('substitutes/batch/', views.substitutes_batch, name='substitutes_batch'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
     path('results/<int:product_id>/', views.results, name='results'),
     path('detail/<int:product_id>/', views.detail, name='detail'),
     path('userpage/', views.userpage, name='userpage'),
@@ -4,16 +4,23 @@
 foodSearch views
 """
 
+import json
+
 from django.shortcuts import render
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import authenticate, login, update_session_auth_hash
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import AuthenticationForm, PasswordChangeForm
 from django.core.paginator import Paginator
 from django.http import HttpResponse, JsonResponse, Http404
 
+from .autocomplete import MAX_SUGGESTIONS, get_autocomplete
 from .models import Favorite, Product
-from .query_parser import QueryParser
-from .results_parser import ResultsParser
+from .normalize import upper_unaccent
+from .query_parser import QueryParser, search_many
+from . import search_cache
+from .results_parser import ResultsParser, substitutes_many
 from .forms import UserCreationFormWithMail
 
 
@@ -174,30 +181,125 @@ def watchlist(request):
 def search(request):
     """
     View rendering search page where user confirm his search product with one in DB
+    Misspelled words are corrected, unless the exact query is asked (exact parameter)
     This function uses the class QueryParser from module query_parser.py
     """
     query = request.GET.get('query')
     title = query
+    suggestion = None
 
     if query == "":
         found_products = []
     else:
-        parser = QueryParser(query)
-        parser.get_final_list()
-        found_products = parser.product_list[0:12]
+        parser = QueryParser(query, fuzzy=False if request.GET.get('exact') else None)
+        found_products = search_cache.get_final_list(parser)[0:12]
+        if parser.suggestion:
+            suggestion = parser.suggestion.lower()
 
     context = {
         'title' : title,
         'found_products': found_products,
+        'suggestion': suggestion,
     }
     return render(request, 'foodSearch/search.html', context)
 
+@csrf_exempt
+def search_batch(request):
+    """
+    View returning json list of found products for each query of a list
+    (POST json: {"queries": [...], "limit": 12}, at most 200 queries)
+    This function uses the function search_many from module query_parser.py
+    """
+    if request.method != 'POST':
+        raise Http404()
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+        queries = data['queries']
+        limit = int(data.get('limit', 12))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'error': "invalid json"}, status=400)
+    if (not isinstance(queries, list) or len(queries) > 200
+            or not all(isinstance(query, str) for query in queries)):
+        return JsonResponse({'error': "queries must be a list of at most 200 strings"},
+                            status=400)
+    limit = max(1, min(limit, 12))
+
+    response_data = []
+    for parser in search_many(queries, limit):
+        response_data.append({
+            'query': parser.query,
+            'suggestion': parser.suggestion.lower() if parser.suggestion else None,
+            'products': [{'id': product.id,
+                          'name': product.name,
+                          'brands': product.brands,
+                          'nutrition_grade_fr': product.nutrition_grade_fr,
+                          'image_small_url': product.image_small_url,
+                          'results_url': reverse('foodSearch:results', args=[product.id])}
+                         for product in parser.product_list],
+        })
+    return JsonResponse({'results': response_data})
+
+@csrf_exempt
+def substitutes_batch(request):
+    """
+    View returning json list of the most relevant substitutes of each product of a list
+    (POST json: {"products": [ids], "limit": 24}, at most 100 products)
+    This function uses the function substitutes_many from module results_parser.py
+    """
+    if request.method != 'POST':
+        raise Http404()
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+        product_ids = data['products']
+        limit = int(data.get('limit', 24))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'error': "invalid json"}, status=400)
+    if (not isinstance(product_ids, list) or len(product_ids) > 100
+            or not all(isinstance(product_id, int) and not isinstance(product_id, bool)
+                       for product_id in product_ids)):
+        return JsonResponse({'error': "products must be a list of at most 100 ids"},
+                            status=400)
+    limit = max(1, min(limit, 24))
+
+    response_data = []
+    for product_id, (product, substitutes) in zip(product_ids,
+                                                  substitutes_many(product_ids, limit)):
+        response_data.append({
+            'product': product_id,
+            'found': product is not None,
+            'substitutes': [{'id': substitute.id,
+                             'name': substitute.name,
+                             'brands': substitute.brands,
+                             'nutrition_grade_fr': substitute.nutrition_grade_fr,
+                             'image_small_url': substitute.image_small_url,
+                             'detail_url': reverse('foodSearch:detail', args=[substitute.id])}
+                            for substitute in substitutes],
+        })
+    return JsonResponse({'results': response_data})
+
+def autocomplete(request):
+    """
+    View returning json list of products names starting with the typed term
+    This function uses the class Autocomplete from module autocomplete.py
+    """
+    term = upper_unaccent(request.GET.get('term', ''))
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), MAX_SUGGESTIONS))
+    except ValueError:
+        limit = 10
+    return JsonResponse({'results': get_autocomplete().suggest(term, limit)})
+
+def search_stats(request):
+    """View returning hits and misses of the search results cache (staff only)"""
+    if not request.user.is_staff:
+        raise Http404()
+    return JsonResponse(search_cache.get_stats())
+
 def results(request, product_id):
     """
     View rendering results page showing more relevant substitutes
     This function uses the class ResultsParser from module results_parser.py
     """
-    title = Product.objects.get(id=product_id).name
     page = request.GET.get('page')
     current_user = request.user
     parser = ResultsParser(product_id, current_user)
@@ -205,7 +307,7 @@ def results(request, product_id):
         page = 1
 
     context = {
-        'title':title,
+        'title':parser.product.name,
         'product':parser.product,
         'result': parser.paginator(page),
         'page':page,
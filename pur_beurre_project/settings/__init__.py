@@ -149,3 +149,69 @@ INTERNAL_IPS = ['127.0.0.1']
 LOGOUT_REDIRECT_URL = '/'
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+# Caches
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# 'search' keeps results of popular searches in each worker (LRU with a timeout)
+# 'shared' is shared by all workers and commands (./manage.py createcachetable),
+# it only keeps the catalog version: with so few keys it never reaches MAX_ENTRIES,
+# so it is never culled (don't add per-user keys here)
+# 'substitutes' keeps ranked substitutes of the most viewed products for all workers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'search': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'search',
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'foodsearch_cache',
+        'TIMEOUT': None,
+    },
+    'substitutes': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'foodsearch_substitutes_cache',
+        'TIMEOUT': 86400,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+
+# Search
+# backend ranking products found by QueryParser:
+# - foodSearch.search_backends.IndexSearchBackend (in-memory index, any database)
+# - foodSearch.search_backends.BM25SearchBackend (in-memory index, BM25 ranking)
+# - foodSearch.search_backends.PostgresSearchBackend (full text search, PostgreSQL only)
+SEARCH_BACKEND = 'foodSearch.search_backends.IndexSearchBackend'
+
+# correct misspelled words of queries with products names and brands words
+SEARCH_FUZZY = True
+
+# minimum delay (in seconds) between two checks of products changes
+# by the in-memory search index of each worker
+SEARCH_INDEX_REFRESH_INTERVAL = 0
+
+# minimum delay (in seconds) between two checks of the catalog version
+# by the autocomplete list of each worker
+AUTOCOMPLETE_REFRESH_INTERVAL = 60
+
+# Substitutes
+# ranking of substitutes with as many categories in common with the product:
+# - 'categories' (by id)
+# - 'nutrients' (best improvement of energy, sugars, saturated fat and salt first)
+SUBSTITUTE_RANKING = 'categories'
+
+# rank substitutes with the products x categories matrix kept in memory by each worker
+# instead of counting categories in common in database
+SUBSTITUTE_MATRIX = False
+
+# minimum delay (in seconds) between two checks of the catalog version
+# by the category matrix of each worker
+SUBSTITUTE_MATRIX_REFRESH_INTERVAL = 60
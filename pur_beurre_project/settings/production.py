@@ -2,6 +2,9 @@ from . import *
 
 DEBUG = False
 
+SEARCH_BACKEND = 'foodSearch.search_backends.PostgresSearchBackend'
+SEARCH_INDEX_REFRESH_INTERVAL = 60
+
 import sentry_sdk
 from sentry_sdk.integrations.django import DjangoIntegration
 